@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+
+from typing import Iterable, List
+
+from executor import Step, check, get_executor, script
+
+# Binaries are built once per (repository, version, build command, flags) and
+# kept in a local cache directory named after the hash of these. Deploying a
+# binary copies it from the cache to the nodes that do not have the same file
+# yet, so that only the first deploy of a version builds anything.
+
+BUILD_CACHE: str = os.environ.get("HYDRA_BUILD_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "hydra", "builds"))
+# where the nodes keep the binaries, relative to the home directory
+REMOTE_BUILD_DIR: str = ".cache/hydra/builds"
+
+
+class Build:
+    def __init__(
+        self,
+        name: str,
+        repo: str,
+        version: str,
+        binary: str,
+        build_cmd: str,
+        source_path: str,
+        dependencies: Iterable[str] = (),
+        flags: str = "",
+    ):
+        """A binary built from a git repository.
+
+        Args:
+            name: the name of the build, e.g. memcached
+            repo: the git repository
+            version: the tag or commit to build
+            binary: the binary, relative to the checkout
+            build_cmd: the command that builds the binary in the checkout;
+                {flags} is replaced with flags
+            source_path: the checkout on the node that builds
+            dependencies: Debian packages to build and run the binary
+            flags: configure flags
+        """
+        self.name = name
+        self.repo = repo
+        self.version = version
+        self.binary = binary
+        self.build_cmd = build_cmd
+        self.source_path = source_path
+        self.dependencies = list(dependencies)
+        self.flags = flags
+
+    @property
+    def key(self) -> str:
+        """Hash of what determines the binary."""
+        spec = json.dumps([self.repo, self.version, self.build_cmd, self.flags])
+        return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+    def _relative_path(self) -> str:
+        return os.path.join(f"{self.name}-{self.version}-{self.key}", os.path.basename(self.binary))
+
+    @property
+    def local_path(self) -> str:
+        return os.path.join(BUILD_CACHE, self._relative_path())
+
+    @property
+    def remote_path(self) -> str:
+        """The binary on the nodes, relative to the home directory."""
+        return os.path.join(REMOTE_BUILD_DIR, self._relative_path())
+
+    @property
+    def path(self) -> str:
+        """The binary on the nodes, for use in commands."""
+        return f"~/{self.remote_path}"
+
+    def dependency_steps(self) -> List[Step]:
+        if not self.dependencies:
+            return []
+        packages = ' '.join(self.dependencies)
+        return [Step(f"dpkg -s {packages} >/dev/null 2>&1 || apt-get install -y {packages}",
+                     task_name=f"Installing {self.name} dependencies", sudo=True)]
+
+    def build_steps(self) -> List[Step]:
+        return self.dependency_steps() + [
+            Step(f"(test -d {self.source_path}/.git || git clone -q {self.repo} {self.source_path}) && "
+                 f"cd {self.source_path} && (git checkout -q {self.version} || (git fetch -q && git checkout -q {self.version}))",
+                 task_name=f"Checking out {self.name}"),
+            Step(self.build_cmd.format(flags=self.flags), task_name=f"Building {self.name}",
+                 remote_working_dir=self.source_path),
+            Step(f"mkdir -p $(dirname {self.path}) && cp {os.path.join(self.source_path, self.binary)} {self.path}"),
+        ]
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as fo:
+            for block in iter(lambda: fo.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def deploy(self, nodes: Iterable) -> str:
+        """Put the binary on the nodes.
+
+        The binary is built on the first node only when it is not in the
+        local cache yet, and copied only to the nodes whose copy is missing
+        or differs from the cached one.
+
+        Args:
+            nodes: the nodes that run the binary
+
+        Returns:
+            the path of the binary on the nodes
+        """
+        nodes = list(nodes)
+        executor = get_executor()
+        if not os.path.exists(self.local_path):
+            check(executor.run(script(self.build_steps(), executor.sudo), nodes[:1]), f"building {self.name}")
+            executor.get(nodes[0], self.remote_path, self.local_path)
+        digest = Build._sha256(self.local_path)
+
+        # one call checks the dependencies and the checksum on every node
+        checksum = Step(f"(sha256sum {self.path} 2>/dev/null || true) | cut -c1-64")
+        results = check(executor.run(script(self.dependency_steps() + [checksum], executor.sudo), nodes),
+                        f"checking {self.name}")
+        stale = [node for node in nodes if results[node.alias].stdout.strip() != digest]
+        executor.put(stale, self.local_path, self.remote_path)
+        return self.path
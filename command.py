@@ -1,8 +1,10 @@
+import json
 import logging
 import signal
 import os
+import time
 
-from typing import List, Dict, Iterable, Optional
+from typing import Callable, List, Dict, Iterable, Optional, Union
 
 import enoslib as en
 
@@ -14,10 +16,114 @@ from rich.console import Console
 
 from rich import print as rprint
 
+from executor import Step, check, get_executor, script
+
+FACTS_CACHE: str = os.environ.get("HYDRA_FACTS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "hydra", "facts.json"))
+FACTS_TTL: float = float(os.environ.get("HYDRA_FACTS_TTL", 6*3600))
+
+# Facts are discovered with one shell command per host instead of Ansible's
+# setup module; every line of its output is one name=value pair.
+FACTS_CMD: str = (
+    "printf 'user_id=%s\\n' \"$(id -un)\"; "
+    ". /etc/os-release; "
+    "printf 'distribution=%s\\ndistribution_version=%s\\n' \"$ID\" \"$VERSION_ID\"; "
+    "case \" $ID $ID_LIKE \" in *' debian '*) family=Debian;; *) family=Other;; esac; "
+    "printf 'os_family=%s\\n' $family; "
+    "printf 'ibip=%s\\n' \"$(ip -o -4 address show | grep eth | awk '$4 ~ /^10.10/ { print $4 }')\""
+)
+
+
+class HostFacts:
+    def __init__(self, path: str = FACTS_CACHE, ttl: float = FACTS_TTL):
+        """Per-host facts and IB addresses, discovered once and cached locally.
+
+        Facts are kept in a JSON file keyed by host alias and rediscovered
+        when they are older than ttl seconds or the host's address changed.
+        Commands render them per node instead of gathering Ansible facts;
+        playbooks get them as the extra variable host_facts.
+
+        Args:
+            path: the cache file
+            ttl: seconds after which facts are rediscovered
+        """
+        self.path = path
+        self.ttl = ttl
+        self.facts = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as fo:
+                return json.load(fo)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}"
+        with open(tmp, 'w') as fo:
+            json.dump(self.facts, fo, indent=2)
+        os.replace(tmp, self.path)
+
+    def _fresh(self, node: Host) -> bool:
+        entry = self.facts.get(node.alias)
+        return entry is not None and entry['address'] == node.address and time.time() - entry['time'] < self.ttl
+
+    def get(self, nodes: Iterable[Host]) -> Dict[str, Dict[str, str]]:
+        """Facts of the nodes, discovering those missing in one remote call.
+
+        Args:
+            nodes: the nodes
+
+        Returns:
+            the facts per host alias
+        """
+        nodes = list(nodes)
+        stale = [node for node in nodes if not self._fresh(node)]
+        if stale:
+            command = Command(FACTS_CMD, nodes=stale, task_name="Discovering host facts")
+            command.deploy()
+            stdout = command.stdout_to_dict('facts')['facts']
+            now = time.time()
+            for node in stale:
+                if node.alias not in stdout:
+                    raise RuntimeError(f"fact discovery failed on {node.alias}")
+                facts = dict(line.split('=', 1) for line in stdout[node.alias].splitlines() if '=' in line)
+                self.facts[node.alias] = {'address': node.address, 'time': now, 'facts': facts}
+            self._save()
+        return {node.alias: self.facts[node.alias]['facts'] for node in nodes}
+
+    def ibip(self, nodes: Iterable[Host]) -> Dict[str, str]:
+        """IB addresses of the nodes, as the ``ibip`` extra variable of the playbooks."""
+        return {alias: facts['ibip'] for alias, facts in self.get(nodes).items()}
+
+    def extra_vars(self, nodes: Iterable[Host]) -> Dict:
+        """The host_facts extra variable for a play on the nodes."""
+        return {'host_facts': self.get(nodes)}
+
+    def invalidate(self, nodes: Optional[Iterable[Host]] = None):
+        """Forget the facts of the nodes, or of all hosts."""
+        if nodes is None:
+            self.facts = {}
+        else:
+            for node in nodes:
+                self.facts.pop(node.alias, None)
+        self._save()
+
+
+_host_facts = None
+
+def host_facts() -> HostFacts:
+    """The fact cache shared by all commands of this process."""
+    global _host_facts
+    if _host_facts is None:
+        _host_facts = HostFacts()
+    return _host_facts
+
+
 class Command:
     def __init__(
         self, 
-        cmd: str,
+        cmd: Union[str, Callable[[Host], str]],
         nodes: Iterable[Host] = None,
         task_name: str = None,
         remote_working_dir: str = None,
@@ -27,7 +133,9 @@ class Command:
         """Run command on all hosts.
 
         Args:
-            cmd: the command to run
+            cmd: the command to run, or a function of the node that returns it
+            extra_vars: variables of Ansible templates in the command, for
+                the ansible executor
         """
         self.cmd = cmd
         self.nodes = nodes
@@ -37,32 +145,22 @@ class Command:
         self.extra_vars = extra_vars
         self.results = None
 
-    def deploy_actions(self):
-        a = en.actions()
-        shell_kwargs = {}
-        if self.remote_working_dir:
-            shell_kwargs['chdir'] = str(self.remote_working_dir)
-        if self.sudo:
-            shell_kwargs['become'] = "yes"
-            shell_kwargs['become_user'] = "root"
-        if self.task_name:
-            shell_kwargs['task_name'] = self.task_name
-        a.shell(self.cmd, **shell_kwargs) 
-        return a
+    def prepare(self, nodes: Iterable[Host]):
+        """Install what the command needs on the nodes, before its steps run."""
+        pass
+
+    def steps(self, node: Host) -> List[Step]:
+        """The steps that run the command on node."""
+        cmd = self.cmd(node) if callable(self.cmd) else self.cmd
+        return [Step(cmd, task_name=self.task_name, sudo=self.sudo, remote_working_dir=self.remote_working_dir)]
 
     def deploy(self):
-        a = self.deploy_actions()
-        with en.actions(
-            roles=self.nodes, extra_vars=self.extra_vars, gather_facts=True, 
-            priors = [a]
-        ) as p:
-            self.results = p.results
+        executor = get_executor()
+        self.results = executor.run(lambda node: script(self.steps(node), executor.sudo), self.nodes, self.extra_vars)
 
     def output(self):
-        task_filter = self.task_name if self.task_name else 'shell'
-        for result in self.results.filter(task=task_filter):
-            host = result.host
-            for line in result.payload['stdout_lines']:
+        for host, result in self.results.items():
+            for line in result.stdout_lines:
                 rprint(f"[red]{host}[/red]\t{line}")
         
     def stdout_to_dict(self, key):
@@ -72,13 +170,91 @@ class Command:
             key: the key that is assigned the standard output of the command
         """
         d = {}
-        task_filter = self.task_name if self.task_name else 'shell'
-        for result in self.results.filter(task=task_filter):
+        for host, result in self.results.items():
             if result.status == 'OK':
-                d[result.host] = result.stdout
+                d[host] = result.stdout
         return {key: d}
 
 
+class Configfs:
+    def __init__(
+        self,
+        path: str,
+        nodes: Iterable[Host],
+        sudo: bool = True,
+    ):
+        """Write and read attributes of a configfs directory on all hosts.
+
+        Every call is one remote command that writes the attributes in order
+        and reads them all back, instead of one play per write and per read.
+
+        Args:
+            path: the configfs directory, e.g. /sys/kernel/config/hydra/hydrahost0/hydra0
+            nodes: the nodes to configure
+            sudo: whether the attributes are written as root
+        """
+        self.path = path
+        self.nodes = nodes
+        self.sudo = sudo
+
+    def _read_cmd(self, names: Iterable[str]) -> str:
+        # printf of a failed $(cat) still succeeds, so the read exits first
+        return " && ".join(f"{{ v=$(cat {os.path.join(self.path, name)}) || exit 1; printf '%s=%s\\n' {name} \"$v\"; }}"
+                           for name in names)
+
+    @staticmethod
+    def _matches(read: str, value: object) -> bool:
+        if isinstance(value, int) and not isinstance(value, bool):
+            try:
+                return int(read) == value
+            except ValueError:
+                return False
+        return read.strip() == str(value)
+
+    def _run(self, cmd: str) -> Dict[str, Dict[str, str]]:
+        command = Command(cmd, nodes=self.nodes, task_name="configfs", sudo=self.sudo)
+        command.deploy()
+        values = {}
+        for host, stdout in command.stdout_to_dict('configfs')['configfs'].items():
+            values[host] = dict(line.split('=', 1) for line in stdout.splitlines() if '=' in line)
+        missing = [node.alias for node in self.nodes if node.alias not in values]
+        if missing:
+            raise RuntimeError(f"configfs command failed on {', '.join(missing)}: {cmd}")
+        return values
+
+    def read(self, names: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        """Read attributes.
+
+        Args:
+            names: the attributes to read
+
+        Returns:
+            the values read back, per host and attribute
+        """
+        return self._run(self._read_cmd(names))
+
+    def apply(self, attributes: Dict[str, object]) -> Dict[str, Dict[str, str]]:
+        """Write attributes and verify that they took effect.
+
+        Args:
+            attributes: the values to write, in the order to write them
+
+        Returns:
+            the values read back, per host and attribute
+
+        Raises:
+            RuntimeError: a host failed to write an attribute or reads back
+                a different value
+        """
+        writes = [f"echo {value} > {os.path.join(self.path, name)}" for name, value in attributes.items()]
+        values = self._run(" && ".join(writes + [self._read_cmd(attributes)]))
+        for host, read in values.items():
+            for name, value in attributes.items():
+                if not self._matches(read.get(name, ''), value):
+                    raise RuntimeError(f"{host}: {name} is {read.get(name)!r} after writing {value!r}")
+        return values
+
+
 class _MemoryCgroup:
     def __init__(
         self,
@@ -95,17 +271,20 @@ class _MemoryCgroup:
     def parameter_path(self, parameter_name: str):
         return os.path.join("/sys/fs/cgroup", self.cgroup_controller, self.cgroup_path, parameter_name)
 
-    def register_deploy_actions(self, a):
-        a.shell(
-            f"cgcreate -t {{{{ ansible_user_id }}}} -a {{{{ ansible_user_id }}}} -g {self.controller_path_pair()}",
-            task_name=f"Create cgroup {self.controller_path_pair()}",
-            become="yes", become_user="root"
-        )
-        a.shell(
-            f"echo {self.limit_in_bytes} > {self.parameter_path('memory.limit_in_bytes')}",
-            task_name=f"Applying memory limit to cgroup {self.controller_path_pair()}",
-            become="yes", become_user="root"
-        )
+    def steps(self, node: Host) -> List[Step]:
+        user_id = host_facts().get([node])[node.alias]['user_id']
+        return [
+            Step(
+                f"cgcreate -t {user_id} -a {user_id} -g {self.controller_path_pair()}",
+                task_name=f"Create cgroup {self.controller_path_pair()}",
+                sudo=True
+            ),
+            Step(
+                f"echo {self.limit_in_bytes} > {self.parameter_path('memory.limit_in_bytes')}",
+                task_name=f"Applying memory limit to cgroup {self.controller_path_pair()}",
+                sudo=True
+            ),
+        ]
 
 
 class Cgroup:
@@ -139,34 +318,30 @@ class Cgroup:
         return f"cgexec {cgroup_controller_path_pair_str} {cmd}"
 
 
-    def deploy_actions(self):
-        """Deploy the cgroup."""
-        a = en.actions()        
-        a.apt(
-            task_name="Checking cgroup package dependencies",
-            name=["cgroup-bin", "cgroup-lite", "libcgroup1"],
-            state="present",
-            when="ansible_distribution == 'Ubuntu' and ansible_distribution_version == '14.04'",
-            become="yes", become_user="root"
-        )
-
-        self.memory_cgroup.register_deploy_actions(a)
-        cgroup_controller_path_pairs = [self.memory_cgroup.controller_path_pair()]
+    def prepare(self, nodes: Iterable[Host]):
+        self.child.prepare(nodes)
 
-        # Collect the child actions for execution. 
-        # Ensure the last child action is a shell task and modify it to enclose it 
-        # within a cgexec command.
-        child_actions = self.child.deploy_actions()
-        last_child_action = child_actions._tasks.pop()
-        assert 'shell' in last_child_action
+    def steps(self, node: Host) -> List[Step]:
+        """The steps that run the child in the cgroup on node."""
+        steps = []
+        facts = host_facts().get([node])[node.alias]
+        if facts['distribution'] == 'ubuntu' and facts['distribution_version'] == '14.04':
+            steps.append(Step(
+                "dpkg -s cgroup-bin cgroup-lite libcgroup1 >/dev/null 2>&1 || apt-get install -y cgroup-bin cgroup-lite libcgroup1",
+                task_name="Checking cgroup package dependencies",
+                sudo=True
+            ))
+
+        steps += self.memory_cgroup.steps(node)
+        cgroup_controller_path_pairs = [self.memory_cgroup.controller_path_pair()]
 
-        last_child_cmd = last_child_action['shell']
-        child_actions.shell(
-            Cgroup._cgexec(cgroup_controller_path_pairs, f"{last_child_cmd}"),
-            task_name=f"Running {last_child_cmd} in a cgroup",
-        )
+        # Enclose the last child step within a cgexec command.
+        child_steps = self.child.steps(node)
+        last_child_step = child_steps[-1]
+        last_child_step.cmd = Cgroup._cgexec(cgroup_controller_path_pairs, last_child_step.cmd)
+        last_child_step.task_name = f"Running {last_child_step.task_name or last_child_step.cmd} in a cgroup"
 
-        return en.actions(priors = [a, child_actions])
+        return steps + child_steps
 
     def destroy(self):
         """Destroy the cgroup."""
@@ -270,61 +445,44 @@ class Session:
         return cmd
 
 
-    def deploy(self):
-        """Deploy the session."""
-        a = en.actions()        
-        a.shell(
-            "which tmux || (apt update && apt install -y tmux)",
+    def steps(self, node: Host) -> List[Step]:
+        """The steps that start the child in the session on node."""
+        steps = [Step(
+            "which tmux || (command -v apt-get && apt-get update && apt-get install -y tmux)",
             task_name="Checking tmux",
-            when="ansible_os_family == 'Debian'",
-            become="yes", become_user="root"
-        )
-
-        # Collect the child actions for execution. 
-        # Ensure the last child action is a shell task and modify it to enclose it 
-        # within a tmux command.
-        child_actions = self.child.deploy_actions()
-        last_child_action = child_actions._tasks.pop()
-        assert 'shell' in last_child_action
-
-        last_child_cmd = last_child_action['shell']
-        shell_kwargs = {}
+            sudo=True
+        )]
+
+        # Enclose the last child step within a tmux command.
+        child_steps = self.child.steps(node)
+        last_child_step = child_steps[-1]
+        last_child_step.task_name = f"Running {last_child_step.task_name or last_child_step.cmd} in a tmux session"
+        last_child_step.cmd = Session._bg_start(self.session, last_child_step.cmd)
         if self.remote_working_dir:
-            shell_kwargs['chdir'] = str(self.remote_working_dir)
+            last_child_step.remote_working_dir = str(self.remote_working_dir)
         if self.sudo:
-            child_actions.shell(
-                Session._bg_start(self.session, f"{last_child_cmd}"), 
-                task_name=f"Running {last_child_cmd} in a tmux session",
-                become="yes", become_user="root",
-                **shell_kwargs)
+            last_child_step.sudo = True
 
-        else:
-            child_actions.shell(
-                Session._bg_start(self.session, f"{last_child_cmd}"), 
-                task_name=f"Running {last_child_cmd} in a tmux session",
-                **shell_kwargs) 
-
-        # Execute the actions
-        with en.actions(
-            roles=self.nodes, extra_vars=self.extra_vars, gather_facts=True, 
-            priors = [a, child_actions]
-        ) as p:
-            results = p.results
-            pass
+        return steps + child_steps
+
+    def deploy(self):
+        """Deploy the session."""
+        # discover missing facts of all nodes at once rather than per node
+        host_facts().get(self.nodes)
+        self.child.prepare(self.nodes)
+        executor = get_executor()
+        results = executor.run(lambda node: script(self.steps(node), executor.sudo), self.nodes, self.extra_vars)
+        check(results, f"session {self.session}")
 
     def destroy(self):
         """Destroy the session.
 
         This kills the session processes on the nodes.
         """
-        with en.actions(roles=self.nodes, extra_vars=self.extra_vars) as p:
-            kill_cmd = Session._bg_stop(self.session)
-            p.shell(kill_cmd, task_name="Killing existing session")
+        get_executor().run(Session._bg_stop(self.session), self.nodes, self.extra_vars)
 
     def output(self):
-        results = en.run_command(Session._bg_capture(self.session), roles = self.nodes)
-        for result in results:
-            host = result.host
-            for line in result.payload['stdout_lines']:
+        results = get_executor().run(Session._bg_capture(self.session), self.nodes)
+        for host, result in results.items():
+            for line in result.stdout_lines:
                 rprint(f"[red]{host}[/red]\t{line}")
-        
\ No newline at end of file
@@ -0,0 +1,316 @@
+import concurrent.futures
+import os
+import shlex
+import shutil
+import subprocess
+
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+# Commands are sent to the hosts as one shell script per host. Backends:
+#
+#   ssh      OpenSSH with one persistent multiplexed connection per host
+#            (ControlMaster), so that a command costs one round trip
+#   local    subprocesses on this machine, once per node, to run and test the
+#            harness against localhost
+#   ansible  an enoslib play per call, for commands templated with Ansible
+#            variables
+#
+# The backend is chosen with HYDRA_EXECUTOR or set_executor(). Hosts run
+# concurrently in all backends.
+
+EXECUTOR: str = os.environ.get("HYDRA_EXECUTOR", "ssh")
+SSH_CONTROL_DIR: str = os.environ.get("HYDRA_SSH_CONTROL_DIR", os.path.join(os.path.expanduser("~"), ".ssh", "hydra"))
+SSH_CONTROL_PERSIST: str = os.environ.get("HYDRA_SSH_CONTROL_PERSIST", "10m")
+
+
+class Step:
+    def __init__(
+        self,
+        cmd: str,
+        task_name: str = None,
+        sudo: bool = False,
+        remote_working_dir: str = None,
+        environment: Optional[Dict] = None,
+    ):
+        """One shell command of a script.
+
+        Args:
+            cmd: the command to run
+            task_name: a name for logs and errors
+            sudo: whether the command runs as root
+            remote_working_dir: the directory to run the command in
+            environment: extra environment variables of the command
+        """
+        self.cmd = cmd
+        self.task_name = task_name
+        self.sudo = sudo
+        self.remote_working_dir = remote_working_dir
+        self.environment = environment if environment is not None else {}
+
+    def script(self, sudo: str = "sudo -n") -> str:
+        cmd = self.cmd
+        if self.environment:
+            cmd = ' '.join(f"export {k}={shlex.quote(str(v))};" for k, v in self.environment.items()) + f" {cmd}"
+        if self.remote_working_dir:
+            cmd = f"cd {self.remote_working_dir} && {cmd}"
+        if self.sudo and sudo:
+            return f"{sudo} bash -c {shlex.quote(cmd)}"
+        return f"( {cmd} )"
+
+
+def script(steps: Iterable[Step], sudo: str = "sudo -n") -> str:
+    """The steps as one script that stops at the first failing step."""
+    return " && ".join(step.script(sudo) for step in steps)
+
+
+class Result:
+    def __init__(self, host: str, rc: int, stdout: str, stderr: str = ""):
+        """Outcome of a command on one host."""
+        self.host = host
+        self.rc = rc
+        self.stdout = stdout
+        self.stderr = stderr
+
+    @property
+    def status(self) -> str:
+        return "OK" if self.rc == 0 else "FAILED"
+
+    @property
+    def stdout_lines(self) -> List[str]:
+        return self.stdout.splitlines()
+
+
+def check(results: Dict[str, Result], what: str = "command") -> Dict[str, Result]:
+    """Raise unless the command succeeded on every host.
+
+    Raises:
+        RuntimeError: the command failed on some host
+    """
+    failed = [r for r in results.values() if r.status != "OK"]
+    if failed:
+        details = '; '.join(f"{r.host} (exit {r.rc}): {r.stderr.strip()[-200:]}" for r in failed)
+        raise RuntimeError(f"{what} failed on {details}")
+    return results
+
+
+# a script per host: the same for all, or rendered from the node
+Scripts = Union[str, Dict[str, str], Callable]
+
+
+class Executor:
+    sudo = "sudo -n"
+    # whether the backend renders Ansible templates such as {{ var }}
+    templates = False
+
+    def _scripts(self, scripts: Scripts, nodes) -> Dict[str, str]:
+        if isinstance(scripts, str):
+            rendered = {node.alias: scripts for node in nodes}
+        elif isinstance(scripts, dict):
+            rendered = {node.alias: scripts[node.alias] for node in nodes}
+        else:
+            rendered = {node.alias: scripts(node) for node in nodes}
+        templated = [alias for alias, s in rendered.items() if "{{" in s]
+        if templated and not self.templates:
+            raise ValueError(f"the {type(self).__name__} cannot render Ansible templates, use the ansible executor")
+        return rendered
+
+    def run(self, scripts: Scripts, nodes: Iterable, extra_vars: Optional[Dict] = None) -> Dict[str, Result]:
+        """Run a script on every node concurrently.
+
+        Args:
+            scripts: the script, a script per host alias, or a function of
+                the node that returns its script
+            nodes: the nodes to run on
+            extra_vars: variables of Ansible templates, for the ansible executor
+
+        Returns:
+            the result per host alias
+        """
+        nodes = list(nodes)
+        rendered = self._scripts(scripts, nodes)
+        if not nodes:
+            return {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            futures = {node.alias: pool.submit(self._run_one, node, rendered[node.alias]) for node in nodes}
+            return {alias: future.result() for alias, future in futures.items()}
+
+    def _run_one(self, node, script: str) -> Result:
+        raise NotImplementedError
+
+    def put(self, nodes: Iterable, local_path: str, remote_path: str):
+        """Copy a local file to the nodes concurrently.
+
+        The file is copied next to remote_path and renamed, so that a
+        failed copy never leaves a partial file behind.
+
+        Args:
+            nodes: the nodes to copy to
+            local_path: the file to copy
+            remote_path: the destination, relative to the home directory
+        """
+        nodes = list(nodes)
+        if not nodes:
+            return
+        check(self.run(f"mkdir -p ~/{os.path.dirname(remote_path)}", nodes), f"creating the directory of {remote_path}")
+        # temporary files per node, for nodes that share a file system
+        parts = {node.alias: f"{remote_path}.{node.alias}.part" for node in nodes}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            futures = [pool.submit(self._put_one, node, local_path, parts[node.alias]) for node in nodes]
+            for future in futures:
+                future.result()
+        renames = {alias: f"mv ~/{part} ~/{remote_path}" for alias, part in parts.items()}
+        check(self.run(renames, nodes), f"copying {local_path} to {remote_path}")
+
+    def get(self, node, remote_path: str, local_path: str):
+        """Copy remote_path, relative to the home directory, from node to local_path."""
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        self._get_one(node, remote_path, f"{local_path}.part")
+        os.replace(f"{local_path}.part", local_path)
+
+    def _put_one(self, node, local_path: str, remote_path: str):
+        raise NotImplementedError
+
+    def _get_one(self, node, remote_path: str, local_path: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalExecutor(Executor):
+    """Runs every node's script on this machine, e.g. for a localhost inventory."""
+
+    def __init__(self):
+        self.sudo = "" if os.geteuid() == 0 else "sudo -n"
+
+    def _run_one(self, node, script: str) -> Result:
+        p = subprocess.run(["bash", "-c", script], capture_output=True, text=True)
+        return Result(node.alias, p.returncode, p.stdout, p.stderr)
+
+    def _put_one(self, node, local_path: str, remote_path: str):
+        shutil.copy2(local_path, os.path.join(os.path.expanduser("~"), remote_path))
+
+    def _get_one(self, node, remote_path: str, local_path: str):
+        shutil.copy2(os.path.join(os.path.expanduser("~"), remote_path), local_path)
+
+
+class SSHExecutor(Executor):
+    """Runs scripts over persistent multiplexed OpenSSH connections.
+
+    The first command to a host opens a master connection that later
+    commands reuse without a new handshake; it closes after
+    SSH_CONTROL_PERSIST of inactivity or on close().
+    """
+
+    def __init__(self, control_dir: str = SSH_CONTROL_DIR, persist: str = SSH_CONTROL_PERSIST):
+        self.control_dir = control_dir
+        self.persist = persist
+        self._hosts = {}
+
+    def _options(self, node) -> List[str]:
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        options = [
+            "-o", "BatchMode=yes",
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={os.path.join(self.control_dir, '%C')}",
+            "-o", f"ControlPersist={self.persist}",
+            "-o", "StrictHostKeyChecking=accept-new",
+        ]
+        if getattr(node, 'keyfile', None):
+            options += ["-i", str(node.keyfile)]
+        return options
+
+    def _destination(self, node) -> str:
+        user = getattr(node, 'user', None)
+        return f"{user}@{node.address}" if user else node.address
+
+    def _ssh(self, node) -> List[str]:
+        cmd = ["ssh"] + self._options(node)
+        if getattr(node, 'port', None):
+            cmd += ["-p", str(node.port)]
+        cmd.append(self._destination(node))
+        self._hosts[node.alias] = cmd
+        return cmd
+
+    def _run_one(self, node, script: str) -> Result:
+        p = subprocess.run(self._ssh(node) + ["bash -c " + shlex.quote(script)], capture_output=True, text=True)
+        return Result(node.alias, p.returncode, p.stdout, p.stderr)
+
+    # scp over the connection of ssh; remote paths are relative to the home
+    # directory
+    def _scp(self, node, source: str, destination: str):
+        # open the master connection first, so that scp reuses it
+        self._run_one(node, "true")
+        cmd = ["scp", "-q"] + self._options(node)
+        if getattr(node, 'port', None):
+            cmd += ["-P", str(node.port)]
+        p = subprocess.run(cmd + [source, destination], capture_output=True, text=True)
+        if p.returncode != 0:
+            raise RuntimeError(f"copying {source} to {destination} failed: {p.stderr.strip()}")
+
+    def _put_one(self, node, local_path: str, remote_path: str):
+        self._scp(node, local_path, f"{self._destination(node)}:{remote_path}")
+
+    def _get_one(self, node, remote_path: str, local_path: str):
+        self._scp(node, f"{self._destination(node)}:{remote_path}", local_path)
+
+    def close(self):
+        for cmd in self._hosts.values():
+            subprocess.run(cmd[:-1] + ["-O", "exit", cmd[-1]], capture_output=True)
+        self._hosts.clear()
+
+
+class AnsibleExecutor(Executor):
+    """Runs scripts as a shell task of one enoslib play, rendering Ansible templates."""
+
+    templates = True
+
+    def run(self, scripts: Scripts, nodes: Iterable, extra_vars: Optional[Dict] = None) -> Dict[str, Result]:
+        import enoslib as en
+
+        nodes = list(nodes)
+        rendered = self._scripts(scripts, nodes)
+        extra_vars = dict(extra_vars) if extra_vars else {}
+        extra_vars['hydra_script'] = rendered
+        with en.actions(roles=nodes, extra_vars=extra_vars, gather_facts=False) as p:
+            p.shell("{{ hydra_script[inventory_hostname] }}", executable="/bin/bash", task_name="hydra script")
+        results = {}
+        for r in p.results.filter(task="hydra script"):
+            payload = r.payload
+            results[r.host] = Result(r.host, payload.get('rc', 0 if r.status == 'OK' else 1),
+                payload.get('stdout', ''), payload.get('stderr', payload.get('msg', '')))
+        return results
+
+    def _put_one(self, node, local_path: str, remote_path: str):
+        import enoslib as en
+
+        with en.actions(roles=[node], gather_facts=False) as p:
+            p.copy(src=local_path, dest=f"~/{remote_path}", mode="preserve", task_name="hydra put")
+
+    def _get_one(self, node, remote_path: str, local_path: str):
+        import enoslib as en
+
+        with en.actions(roles=[node], gather_facts=False) as p:
+            p.fetch(src=f"~/{remote_path}", dest=local_path, flat=True, task_name="hydra get")
+
+
+BACKENDS = {'ssh': SSHExecutor, 'local': LocalExecutor, 'ansible': AnsibleExecutor}
+
+_executor = None
+
+def get_executor() -> Executor:
+    """The executor of this process, by default the HYDRA_EXECUTOR backend."""
+    global _executor
+    if _executor is None:
+        if EXECUTOR not in BACKENDS:
+            raise ValueError(f"unknown executor '{EXECUTOR}', expected one of {', '.join(BACKENDS)}")
+        _executor = BACKENDS[EXECUTOR]()
+    return _executor
+
+def set_executor(executor: Union[str, Executor]) -> Executor:
+    """Use executor, a backend name or instance, for all later commands."""
+    global _executor
+    if _executor is not None:
+        _executor.close()
+    _executor = BACKENDS[executor]() if isinstance(executor, str) else executor
+    return _executor
@@ -1,49 +1,144 @@
-from typing import Dict, Iterable, List, Optional
+import json
+import os
+import shlex
+import signal
+import time as _time
 
-import enoslib as en
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from enoslib.api import actions
+import enoslib as en
 
 from enoslib.api import bg_start, bg_stop
 
 from enoslib.objects import Host, PathLike, Roles
 
+from build import Build
+from executor import Step, check, get_executor, script
+
 MCPERF_SESSION = "__enoslib_mcperf__"
 
+DATASETS: str = os.environ.get("HYDRA_DATASETS", os.path.join(os.path.expanduser("~"), ".cache", "hydra", "datasets.json"))
+# keys sampled from the loaded dataset to verify it is still there
+DATASET_SAMPLES: int = 4
+
 class Memcached(en.service.service.Service):
     def __init__(
         self, 
-        mem: int = None
+        mem: int = None,
+        configure_flags: str = ""
     ):
         """Deploy memcached on all hosts.
 
         Args:
           mem: max memory to use for object storage, specified in MBs
+          configure_flags: flags of memcached's configure script
         """
         self.mem = mem
         self.memcached_path = "~/memcached"
         self.repo = "https://github.com/memcached/memcached.git"
         self.version = "1.6.12"
+        self.build = Build("memcached", self.repo, self.version, "memcached",
+                           "./autogen.sh && ./configure {flags} && make -j4", self.memcached_path,
+                           dependencies = ["libevent-dev"], flags = configure_flags)
 
-    def deploy_actions(self):
-        a = actions()
-        a.apt(
-            name=["libevent-dev"],
-            state="present",
-            become="yes", become_user="root"
-        )
-        a.git(
-            repo = self.repo,
-            dest = self.memcached_path,
-            version = self.version
-        )
-        a.shell("cd {} && ./autogen.sh && ./configure && make -j4".format(self.memcached_path), 
-                task_name = "Build memcached")
+    def prepare(self, nodes: Iterable[Host]):
+        """Put the memcached binary on the nodes, building it only once."""
+        self.build.deploy(nodes)
+
+    def steps(self, node: Host) -> List[Step]:
+        """The steps that run memcached on node."""
         args = ""
         if self.mem is not None:
             args += f"-m {self.mem}"
-        a.shell(f"{self.memcached_path}/memcached {args}", task_name = "Run memcached")
-        return a
+        return [Step(f"{self.build.path} {args}", task_name = "Run memcached")]
+
+
+def _memcached_request(server: str, lines: List[str]) -> str:
+    """The command that sends lines to memcached at server ("host" or "host:port") and prints the reply."""
+    host, _, port = server.partition(':')
+    request = ' '.join(shlex.quote(line) for line in lines + ['quit'])
+    return f"exec 3<>/dev/tcp/{host}/{port or 11211} && printf '%s\\r\\n' {request} >&3 && cat <&3"
+
+
+def _parse_stats(reply: str) -> Dict[str, str]:
+    stats = {}
+    for line in reply.splitlines():
+        fields = line.strip().split(' ')
+        if fields[0] == 'STAT' and len(fields) >= 3:
+            stats[fields[1]] = fields[2]
+    return stats
+
+
+class LoadedDatasets:
+    def __init__(self, path: str = DATASETS):
+        """What dataset each memcached instance holds, recorded locally.
+
+        A record is valid while the server runs the same memcached process
+        (same pid and start time), holds the same number of items without
+        new evictions, and still returns the keys sampled after the load.
+        The check is one request from the node that runs the benchmarks.
+
+        Args:
+            path: the file of the records
+        """
+        self.path = path
+        try:
+            with open(self.path) as fo:
+                self.datasets = json.load(fo)
+        except (OSError, ValueError):
+            self.datasets = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}"
+        with open(tmp, 'w') as fo:
+            json.dump(self.datasets, fo, indent=2)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _request(node: Host, server: str, lines: List[str]) -> str:
+        results = check(get_executor().run(_memcached_request(server, lines), [node]), f"querying memcached at {server}")
+        return results[node.alias].stdout
+
+    @staticmethod
+    def _instance(stats: Dict[str, str]) -> Tuple[int, int]:
+        return int(stats['pid']), int(stats['time']) - int(stats['uptime'])
+
+    def matches(self, node: Host, server: str, dataset: Dict) -> bool:
+        """Whether memcached at server, as seen from node, still holds dataset."""
+        record = self.datasets.get(server)
+        if record is None or record['dataset'] != dataset:
+            return False
+        reply = self._request(node, server, ["stats"] + ([f"get {' '.join(record['keys'])}"] if record['keys'] else []))
+        stats = _parse_stats(reply)
+        if not stats:
+            return False
+        pid, started = self._instance(stats)
+        # the start time is derived from seconds and may be off by one
+        return (
+            pid == record['pid'] and abs(started - record['started']) <= 1
+            and int(stats['curr_items']) == record['curr_items']
+            and int(stats['evictions']) == record['evictions']
+            and sum(line.startswith('VALUE ') for line in reply.splitlines()) == len(record['keys'])
+        )
+
+    def record(self, node: Host, server: str, dataset: Dict):
+        """Record that memcached at server has just been loaded with dataset."""
+        stats_items = self._request(node, server, ["stats", "stats items"])
+        stats = _parse_stats(stats_items)
+        slabs = sorted({name.split(':')[1] for name in stats if name.startswith('items:')}, key=int)[:DATASET_SAMPLES]
+        dumps = self._request(node, server, [f"stats cachedump {slab} 1" for slab in slabs]) if slabs else ''
+        keys = [line.split(' ')[1] for line in dumps.splitlines() if line.startswith('ITEM ')]
+        pid, started = self._instance(stats)
+        self.datasets[server] = {
+            'dataset': dataset, 'pid': pid, 'started': started, 'curr_items': int(stats['curr_items']),
+            'evictions': int(stats['evictions']), 'keys': keys, 'time': _time.time(),
+        }
+        self._save()
+
+    def forget(self, server: str):
+        self.datasets.pop(server, None)
+        self._save()
 
 
 class MemcachePerf(en.service.service.Service):
@@ -57,13 +152,20 @@ class MemcachePerf(en.service.service.Service):
         measure_depth: int = 1,
         measure_connections: int = 1,
         environment: Optional[Dict] = None,        
-        priors: Optional[List[actions]] = None,
+        priors: Optional[List[en.actions]] = None,
         extra_vars: Optional[Dict] = None,        
     ):
         """Deploy memcache-perf.
 
+        An instance serves a whole campaign: deploy() builds memcache-perf
+        the first time only and afterwards merely restarts the agents that
+        died, so it can be called before every benchmark at the cost of one
+        health check.
+
         Args:
-          nodes: the nodes to install memcached on
+          master: the node that runs the benchmarks
+          workers: the nodes that run the agents
+          priors: enoslib actions run on all nodes before the first install
         """
         self.master = master
         self.workers = workers if workers is not None else []
@@ -84,61 +186,86 @@ class MemcachePerf(en.service.service.Service):
         self.version = "4be8194"
         # self.version = "5e195b300db895550b2bc1a143c21e3210ddddc6"
 
+        self.build = Build("memcache-perf", self.repo, self.version, "mcperf", "make -j4", self.memcache_perf_path,
+                           dependencies = ["libevent-dev", "libzmq3-dev"])
+        self.prepared = False
+
+    def _nodes(self) -> List[Host]:
+        return [self.master] + [w for w in self.workers if w.alias != self.master.alias]
+
     def _prepare(self):
-        """Installs the memcache perf dependencies."""
-        with actions(
-            pattern_hosts="all",
-            roles=self.roles,
-            priors=self.priors,
-            extra_vars=self.extra_vars,
-        ) as p:
-            p.apt(
-                task_name="Installing memcache-perf dependencies",
-                name=["libevent-dev", "libzmq3-dev"],
-                state="present",
-                become="yes", become_user="root"
-            )
-            p.git(
-                task_name="Cloning memcache-perf source repository",
-                repo = self.repo,
-                dest = self.memcache_perf_path,
-                version = self.version
-            )
-            p.shell(
-                task_name = "Building memcache-perf",
-                cmd = "cd {} && make -j4".format(self.memcache_perf_path), 
-            )
-
-    def _run_workers(self):
-        environment: Dict = dict(**self.environment)
-        with actions(
-            pattern_hosts="worker", roles=self.roles, extra_vars=self.extra_vars
-        ) as p:
-            cmd = (
-                f"{self.memcache_perf_path}/mcperf "
-                f"--threads={self.threads} "
-                "--agentmode"
-                # "--agentmode 1> /tmp/out 2>&1 &"
-            )
-            print(bg_start(MCPERF_SESSION, cmd))
-            p.shell(
-                bg_start(MCPERF_SESSION, cmd),
-                environment=environment,
-                task_name=f"Running memcache-perf on agents...",
-            )
+        """Installs memcache-perf and its dependencies."""
+        if self.priors:
+            with en.actions(roles=self._nodes(), priors=self.priors, extra_vars=self.extra_vars):
+                pass
+        self.build.deploy(self._nodes())
+        self.prepared = True
+
+    def _agent_cmd(self) -> str:
+        return f"{self.build.path} --threads={self.threads} --agentmode"
+
+    def healthy(self) -> Dict[str, bool]:
+        """Whether the agent of every worker is running, in one remote call.
+
+        Returns:
+            per worker alias, whether its agent session and process are alive
+        """
+        check_cmd = f"tmux has-session -t {MCPERF_SESSION} 2>/dev/null && pgrep -u \"$(id -u)\" -f '[m]cperf .*--agentmode' >/dev/null"
+        results = get_executor().run(check_cmd, self.workers, self.extra_vars)
+        return {alias: result.status == 'OK' for alias, result in results.items()}
+
+    def _run_workers(self, workers: Iterable[Host]):
+        executor = get_executor()
+        workers = list(workers)
+        steps = [
+            # clear what is left of a dead agent's session
+            Step(bg_stop(MCPERF_SESSION, signal.SIGHUP)),
+            Step(bg_start(MCPERF_SESSION, self._agent_cmd()), task_name = "Running memcache-perf on agents...",
+                 environment = self.environment),
+        ]
+        check(executor.run(script(steps, executor.sudo), workers, self.extra_vars), "starting memcache-perf agents")
 
     def deploy(self):
-        """Install and run memcache-perf on the nodes."""
-        self._prepare()
-        self._run_workers()
+        """Install memcache-perf once and (re)start the agents that are not running."""
+        if not self.prepared:
+            self._prepare()
+        healthy = self.healthy()
+        dead = [w for w in self.workers if not healthy.get(w.alias)]
+        if dead:
+            self._run_workers(dead)
 
     def destroy(self):
         """Stop memcache-perf."""
-        with actions(
-            pattern_hosts="all", roles=self.roles, extra_vars=self.extra_vars
-        ) as p:
-            kill_cmd = bg_stop(MCPERF_SESSION)
-            p.shell(kill_cmd)
+        get_executor().run(bg_stop(MCPERF_SESSION), self._nodes(), self.extra_vars)
+
+    def load(
+        self,
+        *,
+        server: str,
+        records: int,
+        iadist: str,
+        keysize: str,
+        valuesize: str,
+        force: bool = False
+    ) -> bool:
+        """Load records into memcached unless it already holds the same dataset.
+
+        Args:
+          server: the memcached server
+          force: load even if the dataset is already there
+
+        Returns:
+          whether records were loaded
+        """
+        datasets = LoadedDatasets()
+        dataset = {'records': records, 'keysize': keysize, 'valuesize': valuesize}
+        if not force and datasets.matches(self.master, server, dataset):
+            print(f"memcached at {server} already holds {dataset}, skipping the load")
+            return False
+        datasets.forget(server)
+        self.run_bench(server = server, load = True, records = records, iadist = iadist, keysize = keysize, valuesize = valuesize)
+        datasets.record(self.master, server, dataset)
+        return True
 
     def run_bench(
         self,
@@ -158,7 +285,7 @@ class MemcachePerf(en.service.service.Service):
 
         load_flag = "--loadonly" if load else "--noload" 
         cmd = (
-            f"{self.memcache_perf_path}/mcperf "
+            f"{self.build.path} "
             f"-s {server} "
             f"{load_flag} "
             f"-r {records} "
@@ -172,16 +299,9 @@ class MemcachePerf(en.service.service.Service):
             cmd += f" -q {qps} -t {time}"
 
         print(cmd)
-        with actions(
-            pattern_hosts="master", roles=self.roles, extra_vars=self.extra_vars
-        ) as p:
-            p.shell(
-                cmd,
-                task_name=f"Running memcache-perf on master...",
-            )
-            results = p.results
+        results = check(get_executor().run(cmd, [self.master], self.extra_vars), "memcache-perf benchmark")
         results_stdout = ''
-        for r in results:
-            print(r.payload['stdout'])
-            results_stdout += (r.payload['stdout'])
-        return results_stdout
\ No newline at end of file
+        for r in results.values():
+            print(r.stdout)
+            results_stdout += r.stdout
+        return results_stdout
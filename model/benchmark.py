@@ -0,0 +1,308 @@
+import argparse
+import datetime
+import decimal
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+import cache
+import nde
+import ramp
+from ramp import K, P_RS, bch_n, complete_replication, erasure_coding
+
+# BENCHMARKS OF THE MODEL'S HOT FUNCTIONS
+#
+# Times every hot function of ramp.py over representative configurations and
+# checks the results against exact Decimal references: direct transcriptions
+# of the formulas with 100 digits, the way the model was originally written.
+# The references of pe and p_nde_bch are the model's original Decimal code,
+# which nde.py replaced.
+#
+# Each run is appended as one JSON line to BENCHMARK_FILE. Every function is
+# compared with its latest earlier timing on the same machine, or with its
+# timing at a given commit, and flagged as slower when its time per call grew
+# by more than the threshold. Memoization is disabled while timing.
+#
+#   python3 benchmark.py
+#   python3 benchmark.py --case p_chipkill pe --baseline 1a2b3c4 --fail-on-slowdown
+
+BENCHMARK_FILE = os.environ.get("RAMP_BENCHMARK_FILE", os.path.join(cache.CACHE_DIR, "benchmarks.jsonl"))
+
+# relative error allowed against the references (see binomial.py)
+RTOL = 1e-10
+
+_DECIMAL_CONTEXT = decimal.Context(prec=100)
+
+# EXACT REFERENCES
+
+def _binomial_terms(n, p, ii):
+    p = decimal.Decimal(p)
+    return [decimal.Decimal(math.comb(n, i)) * p**i * (1-p)**(n-i) for i in ii]
+
+def reference_p_cw(n, t, rber, approximate=True):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        if approximate:
+            return _binomial_terms(n, rber, [t+1])[0]
+        return sum(_binomial_terms(n, rber, range(t+1, n+1)))
+
+def reference_p_chipkill(n, k, t, rber, approximate=True):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        return decimal.Decimal(P_RS) * reference_p_cw(n, t, rber, approximate)
+
+def reference_aj(n, t, j):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        return decimal.Decimal(math.comb(n, j)) / decimal.Decimal(n+1)**t
+
+def reference_pe(n, w, t):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        numer = 0
+        for s in range(0, t+1):
+            for j in range(w-s, w+s+1):
+                numer = numer + reference_aj(n, t, j)*decimal.Decimal(math.comb(n-j, math.ceil((s+w-j)/2)))*decimal.Decimal(math.comb(j, math.ceil((s-w+j)/2)))
+        return numer / decimal.Decimal(math.comb(n, w))
+
+def reference_p_nde_bch(n, t, p):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        s = 0
+        for w in range(t+1, n+1-t):
+            s = s + decimal.Decimal(math.comb(n, w))*(decimal.Decimal(p)**w)*((1-decimal.Decimal(p))**(n-w))*reference_pe(n, w, t)
+        return s
+
+def reference_p_b(b, c, p_c):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        return 1 - (1 - decimal.Decimal(p_c))**math.ceil(b / c)
+
+def reference_p_due(replication_scheme, b, c, p_c):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        pb = reference_p_b(b, c, p_c)
+        if isinstance(replication_scheme, erasure_coding):
+            n = replication_scheme.n_replicas
+            k = replication_scheme.k_replicas
+            return sum(_binomial_terms(n, pb, range(n-k+1, n+1)))
+        return pb**replication_scheme.n_replicas
+
+def reference_a_r(replication_scheme, b, c, p_c):
+    with decimal.localcontext(_DECIMAL_CONTEXT):
+        if isinstance(replication_scheme, erasure_coding):
+            k = replication_scheme.k_replicas
+            m = replication_scheme.m_replicas
+            p = reference_p_b(b / k, c, p_c)
+        else:
+            k = 1
+            m = replication_scheme.n_replicas - 1
+            p = reference_p_b(b, c, p_c)
+        return -k + sum(decimal.Decimal(math.comb(k+i-1, i)) * p**i * (1-p)**k * (k+i) for i in range(0, m+1))
+
+# the linear scan over t that the solver replaced
+def reference_storage_overhead_for_target_uber(k, rber, replication_scheme, b, c, uber):
+    for t in range(0, 1024):
+        n = bch_n(k, t)
+        p_c = reference_p_chipkill(n, k, t, rber)
+        if reference_p_due(replication_scheme, b, c, p_c) < decimal.Decimal(uber):
+            return ramp.storage_overhead(n, k)
+    raise ValueError("no t below 1024 meets the target")
+
+# BENCHMARK CASES
+
+class case:
+    def __init__(self, name, func, points, reference=None, setup=None, repeat=None):
+        self.name = name
+        self.func = func
+        self.points = points
+        self.reference = reference
+        self.setup = setup
+        self.repeat = repeat
+
+def _clear_pe_cache():
+    nde._pe_numer_cache.tables.clear()
+
+def _pipeline():
+    import resilience_model
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            resilience_model.plot_overhead_multifigure()
+        finally:
+            os.chdir(cwd)
+
+def cases():
+    k = K
+    tt = [1, 10, 24]
+    rbers = [1e-4, 2e-4, 1e-3]
+    schemes = [erasure_coding(6, 4), erasure_coding(10, 8), complete_replication(3)]
+    p_cs = [1e-30, 1e-12, 1e-5]
+    bb = [64, 4096]
+    # the Decimal NDE reference is quadratic in n, so it runs on short codewords
+    nde_points = [(bch_n(64, t), t, rber) for t in (1, 2, 4) for rber in (2e-4, 1e-3)]
+    return [
+        case("p_b", ramp.p_b, [(b, 64, p_c) for b in bb for p_c in p_cs], reference_p_b),
+        case("p_cw_precise", ramp.p_cw_precise, [(bch_n(k, t), t, rber) for t in tt for rber in rbers],
+            lambda n, t, rber: reference_p_cw(n, t, rber, approximate=False)),
+        case("p_chipkill", ramp.p_chipkill,
+            [(bch_n(k, t), k, t, rber, approximate) for t in tt for rber in rbers for approximate in (True, False)],
+            reference_p_chipkill),
+        case("pe", lambda n, w, t: float(np.exp(nde.log_pe(n, w, t))),
+            [(n, w, t) for n, t, _ in nde_points for w in (t+1, n//2, n-t)], reference_pe, setup=_clear_pe_cache),
+        case("p_nde_bch", lambda n, t, p: float(nde.p_nde_bch(n, t, p)), nde_points, reference_p_nde_bch,
+            setup=_clear_pe_cache),
+        case("erasure_coding.p_due", lambda s, b, c, p_c: s.p_due(b, c, p_c),
+            [(s, b, 64, p_c) for s in schemes for b in bb for p_c in p_cs], reference_p_due),
+        case("erasure_coding.a_r", lambda s, b, c, p_c: s.a_r(b, c, p_c),
+            [(s, b, 64, p_c) for s in schemes for b in bb for p_c in p_cs], reference_a_r),
+        case("storage_overhead_for_target_uber", ramp.storage_overhead_for_target_uber,
+            [(k, rber, s, b, 64, target) for rber in rbers for s in schemes for b in bb for target in (1e-20, 1e-32)],
+            reference_storage_overhead_for_target_uber),
+        case("plot_overhead_multifigure", _pipeline, [()], repeat=1),
+    ]
+
+# RUNNING
+
+def _relative_error(value, reference):
+    value = decimal.Decimal(float(value))
+    if reference == 0:
+        return float(abs(value))
+    return float(abs(value - reference) / abs(reference))
+
+# seconds per call, the best of repeat passes over the points of a case; fast
+# cases run enough passes per repeat to last at least min_seconds
+def _time(c, repeat, min_seconds=0.05):
+    number = 1
+    while True:
+        best = math.inf
+        for _ in range(c.repeat or repeat):
+            elapsed = 0.
+            for _ in range(number):
+                if c.setup:
+                    c.setup()
+                start = time.perf_counter()
+                for point in c.points:
+                    c.func(*point)
+                elapsed += time.perf_counter() - start
+            best = min(best, elapsed / number)
+        if c.repeat or best * number >= min_seconds:
+            return best / len(c.points)
+        number = max(2*number, int(math.ceil(min_seconds / max(best, 1e-9))))
+
+def run_case(c, repeat=5, check=True):
+    result = {'calls': len(c.points), 'seconds': _time(c, repeat)}
+    if check and c.reference is not None:
+        start = time.perf_counter()
+        references = [decimal.Decimal(c.reference(*point)) for point in c.points]
+        result['reference_seconds'] = (time.perf_counter() - start) / len(c.points)
+        result['max_rel_error'] = max(_relative_error(c.func(*point), r) for point, r in zip(c.points, references))
+    return result
+
+def run(names=None, repeat=5, check=True):
+    enabled = cache.CACHE_ENABLED
+    cache.CACHE_ENABLED = False
+    try:
+        return {c.name: run_case(c, repeat, check) for c in cases() if names is None or c.name in names}
+    finally:
+        cache.CACHE_ENABLED = enabled
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def record(results):
+    return {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': results,
+    }
+
+def load_history(path=BENCHMARK_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as fo:
+        return [json.loads(line) for line in fo if line.strip()]
+
+def save(entry, path=BENCHMARK_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as fo:
+        fo.write(json.dumps(entry) + "\n")
+
+# per function, the result of the latest earlier run of the given commit, or
+# on the same machine, that timed it
+def find_baseline(history, entry, commit=None):
+    baseline = {}
+    for previous in reversed(history):
+        if commit is not None:
+            if not (previous['commit'] and previous['commit'].startswith(commit)):
+                continue
+        elif previous['machine'] != entry['machine']:
+            continue
+        for name, result in previous['results'].items():
+            baseline.setdefault(name, dict(result, commit=previous['commit']))
+    return baseline
+
+# names of the functions whose time per call grew by more than threshold
+def slowdowns(entry, baseline, threshold=0.25):
+    slower = []
+    for name, result in entry['results'].items():
+        before = baseline.get(name)
+        if before and result['seconds'] > before['seconds'] * (1 + threshold):
+            slower.append(name)
+    return slower
+
+def disagreements(entry, rtol=RTOL):
+    return [name for name, result in entry['results'].items() if result.get('max_rel_error', 0.) > rtol]
+
+def report(entry, baseline, slower, wrong, fo=sys.stdout):
+    print(f"{'function':34} {'us/call':>12} {'baseline':>12} {'commit':>10} {'change':>8} {'reference':>12} {'rel.error':>10}", file=fo)
+    for name, result in entry['results'].items():
+        before = baseline.get(name)
+        line = f"{name:34} {result['seconds']*1e6:12.2f}"
+        if before:
+            line += f" {before['seconds']*1e6:12.2f} {before['commit'] or '':>10} {result['seconds']/before['seconds']-1:+8.0%}"
+        else:
+            line += f" {'':12} {'':10} {'':8}"
+        if 'max_rel_error' in result:
+            line += f" {result['reference_seconds']*1e6:12.2f} {result['max_rel_error']:10.1e}"
+        if name in slower:
+            line += "  SLOWER"
+        if name in wrong:
+            line += "  MISMATCH"
+        print(line, file=fo)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the resilience model and check it against exact references")
+    parser.add_argument("--case", nargs='+', help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats; the fastest counts")
+    parser.add_argument("--history", default=BENCHMARK_FILE, help="JSON lines file of earlier runs")
+    parser.add_argument("--baseline", metavar="COMMIT", help="compare with a run of this commit instead of the latest")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that is flagged")
+    parser.add_argument("--no-check", action="store_true", help="skip the comparison with the references")
+    parser.add_argument("--no-save", action="store_true", help="do not append this run to the history")
+    parser.add_argument("--fail-on-slowdown", action="store_true", help="exit with status 2 when a function got slower")
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    entry = record(run(args.case, args.repeat, check=not args.no_check))
+    baseline = find_baseline(history, entry, args.baseline)
+    slower = slowdowns(entry, baseline, args.threshold)
+    wrong = disagreements(entry)
+    report(entry, baseline, slower, wrong)
+    if not args.no_save:
+        save(entry, args.history)
+    if wrong:
+        return 1
+    if slower and args.fail_on_slowdown:
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
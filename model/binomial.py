@@ -0,0 +1,81 @@
+import math
+import numpy as np
+
+# LOG-DOMAIN BINOMIAL KERNELS
+#
+# Shared by the chipkill and the rack-scale redundancy models. All
+# probabilities are passed around as natural logarithms of p and of its
+# complement q = 1-p, so that callers that already work in log space (e.g. a
+# block failure probability derived from a cache line failure probability)
+# keep their full precision.
+#
+# log-factorials come from math.lgamma, which is accurate to a few ulps. For
+# codewords of a few thousand bits this bounds the relative error of a single
+# term to about 1e-12; the truncated tail sums below add at most RTOL on top,
+# so the kernels agree with the 100-digit Decimal sums to a relative error
+# below 1e-10.
+
+RTOL = 1e-15
+
+_log_factorial_table = np.zeros(1)
+
+def log_factorial(n):
+    global _log_factorial_table
+    n = np.asarray(n, dtype=int)
+    n_max = int(np.max(n)) if n.size else 0
+    if n_max >= len(_log_factorial_table):
+        size = max(2*n_max, 1024)
+        _log_factorial_table = np.array([math.lgamma(i+1) for i in range(0, size+1)])
+    return _log_factorial_table[n]
+
+def log_comb(n, i):
+    return log_factorial(n) - log_factorial(i) - log_factorial(np.asarray(n) - np.asarray(i))
+
+def logsumexp(a, axis=0):
+    a = np.asarray(a, dtype=float)
+    a_max = np.max(a, axis=axis, keepdims=True)
+    a_max = np.where(np.isfinite(a_max), a_max, 0.)
+    with np.errstate(divide='ignore'):
+        s = np.log(np.sum(np.exp(a - a_max), axis=axis))
+    return s + np.squeeze(a_max, axis=axis)
+
+# log p and log(1-p) of a probability p
+def log_p_q(p):
+    p = np.asarray(p, dtype=float)
+    with np.errstate(divide='ignore'):
+        return np.log(p), np.log1p(-p)
+
+# log of P[X = i] for X ~ Binomial(n, p)
+#
+# i, n, log_p and log_q broadcast against each other
+def log_binom_pmf(i, n, log_p, log_q):
+    i = np.asarray(i)
+    n = np.asarray(n)
+    with np.errstate(invalid='ignore'):
+        return log_comb(n, i) + np.where(i > 0, i*log_p, 0.) + np.where(n-i > 0, (n-i)*log_q, 0.)
+
+# log of P[X >= j] for X ~ Binomial(n, p)
+#
+# Terms are summed upwards from j in blocks. The sum stops once it is past the
+# mode, consecutive terms shrink by at least a factor of two and the last term
+# is below rtol of the running sum, which bounds the dropped tail by rtol.
+def log_binom_sf(j, n, log_p, log_q, rtol=RTOL, block=64):
+    log_p, log_q = np.broadcast_arrays(np.asarray(log_p, dtype=float), np.asarray(log_q, dtype=float))
+    acc = np.full(log_p.shape, -np.inf)
+    if j > n:
+        return acc
+    log_rtol = math.log(rtol)
+    log_half = math.log(0.5)
+    for i0 in range(max(j, 0), n+1, block):
+        ii = np.arange(i0, min(i0+block, n+1)).reshape((-1,) + (1,)*log_p.ndim)
+        terms = log_binom_pmf(ii, n, log_p, log_q)
+        acc = np.logaddexp(acc, logsumexp(terms, axis=0))
+        last = int(ii.flat[-1])
+        if last == n:
+            break
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_r = math.log((n-last)/(last+1)) + log_p - log_q
+            done = ((terms[-1] - acc <= log_rtol) & (log_r <= log_half)) | (acc == -np.inf)
+        if np.all(done):
+            break
+    return acc
@@ -0,0 +1,263 @@
+import atexit
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import time
+import numpy as np
+
+# PERSISTENT RESULT CACHE
+#
+# Model evaluations are memoized on disk, keyed by a digest of the function,
+# of the code it depends on and of its exact arguments. Entries live in one
+# SQLite file that every process of a run (and every later run) shares; the
+# least recently used entries are evicted once the file grows past max_bytes.
+#
+# The code digest of a function covers its own source and default arguments
+# and, transitively, the source of every function, class or module of this
+# directory it refers to, and the value of every constant (number, string or
+# tuple) it reads from its module, so editing a model function or a constant
+# such as P_RS invalidates exactly the results that depend on it.
+#
+# New entries are written in batches of CACHE_BATCH, and at exit or at the end
+# of a sweep chunk, in one transaction each. Results that took less than
+# CACHE_MIN_SECONDS to compute are only kept in memory, since storing them
+# costs more than computing them again.
+#
+# The cache is off for library use, so that importing the model writes
+# nothing; resilience_model.py and ramp_cli.py turn it on unless RAMP_CACHE=0,
+# and other callers with configure() or RAMP_CACHE=1.
+
+CACHE_DIR = os.environ.get("RAMP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ramp"))
+CACHE_MAX_BYTES = int(os.environ.get("RAMP_CACHE_MAX_BYTES", 256*1024*1024))
+CACHE_ENABLED = os.environ.get("RAMP_CACHE", "0") == "1"
+CACHE_BATCH = int(os.environ.get("RAMP_CACHE_BATCH", 256))
+CACHE_MIN_SECONDS = float(os.environ.get("RAMP_CACHE_MIN_SECONDS", 1E-3))
+
+_MODEL_DIR = os.path.dirname(os.path.realpath(__file__))
+
+def _is_local(obj):
+    try:
+        path = inspect.getsourcefile(obj)
+    except TypeError:
+        return False
+    return path is not None and os.path.dirname(os.path.realpath(path)) == _MODEL_DIR
+
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+_CONSTANT_TYPES = (bool, int, float, str, tuple, np.generic)
+
+# repr of a constant, or only the type of an object whose repr may carry its address
+def _constant_repr(value):
+    if value is None or isinstance(value, _CONSTANT_TYPES):
+        return repr(value)
+    return type(value).__name__
+
+def _collect_sources(obj, sources):
+    if id(obj) in sources or not _is_local(obj):
+        return
+    sources[id(obj)] = inspect.getsource(obj)
+    if inspect.ismodule(obj):
+        return
+    if inspect.isclass(obj):
+        members = [m for m in vars(obj).values() if inspect.isfunction(m)]
+    else:
+        members = [inspect.unwrap(obj)]
+    for member in members:
+        # defaults are evaluated once, e.g. rtol=RTOL, so their source is not enough
+        defaults = list(member.__defaults__ or ()) + sorted((member.__kwdefaults__ or {}).items())
+        sources[('defaults', id(member))] = f"{member.__qualname__} defaults {[_constant_repr(d) for d in defaults]}"
+        for name in _code_names(member.__code__):
+            dep = member.__globals__.get(name)
+            if inspect.isfunction(dep) or inspect.isclass(dep) or inspect.ismodule(dep):
+                _collect_sources(inspect.unwrap(dep), sources)
+            elif isinstance(dep, _CONSTANT_TYPES):
+                sources[(member.__module__, name)] = f"{member.__module__}.{name} = {dep!r}"
+
+# digest of the source of obj and of the local code it depends on
+@functools.lru_cache(maxsize=None)
+def code_digest(obj):
+    sources = {}
+    _collect_sources(obj, sources)
+    h = hashlib.sha256()
+    for source in sorted(sources.values()):
+        h.update(source.encode())
+    return h.hexdigest()
+
+# canonical, hashable representation of an argument
+def _canonical(obj):
+    if obj is None or isinstance(obj, (bool, int, str)):
+        return (type(obj).__name__, obj)
+    if isinstance(obj, float):
+        return ('float', obj.hex())
+    if isinstance(obj, np.generic):
+        return _canonical(obj.item())
+    if isinstance(obj, np.ndarray):
+        a = np.ascontiguousarray(obj)
+        return ('ndarray', str(a.dtype), a.shape, hashlib.sha256(a.tobytes()).hexdigest())
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__,) + tuple(_canonical(v) for v in obj)
+    if isinstance(obj, range):
+        return ('range', obj.start, obj.stop, obj.step)
+    if isinstance(obj, dict):
+        return ('dict',) + tuple(sorted((repr(_canonical(k)), _canonical(v)) for k, v in obj.items()))
+    if hasattr(obj, '__dict__'):
+        cls = type(obj)
+        return (f"{cls.__module__}.{cls.__qualname__}", code_digest(cls), _canonical(vars(obj)))
+    raise TypeError(f"cannot derive a cache key from {type(obj).__name__}")
+
+def make_key(func, *args, **kwargs):
+    ident = (f"{func.__module__}.{func.__qualname__}", code_digest(func), _canonical(args), _canonical(kwargs))
+    return hashlib.sha256(repr(ident).encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.path = os.path.join(directory, "results.sqlite")
+        self.memory = {}
+        self._pending = []
+        self._touched = set()
+        self._total = 0
+        self._conn = None
+        self._pid = None
+
+    # one connection per process, so that pool workers never share a connection
+    def _db(self):
+        if self._conn is None or self._pid != os.getpid():
+            # entries a forked worker inherits are its parent's to write
+            self._pending = []
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_atime ON results (atime)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS figures (path TEXT PRIMARY KEY, key TEXT)")
+            self._conn.commit()
+            self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        if key in self.memory:
+            return True, self.memory[key]
+        row = self._db().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False, None
+        value = pickle.loads(row[0])
+        self.memory[key] = value
+        self._touched.add(key)
+        return True, value
+
+    def put(self, key, value, persist=True):
+        self.memory[key] = value
+        if not persist:
+            return
+        if self._pid != os.getpid():
+            self._db()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._pending.append((key, blob, len(blob), time.time()))
+        if len(self._pending) >= CACHE_BATCH:
+            self.flush()
+
+    # write the pending entries in one transaction
+    def flush(self):
+        if not self._pending:
+            return
+        db = self._db()
+        if not self._pending:
+            return
+        with db:
+            db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", self._pending)
+        self._total += sum(size for key, blob, size, atime in self._pending)
+        self._pending = []
+        if self._total > self.max_bytes:
+            self._evict()
+
+    # drop least recently used entries until the cache fits in 90% of max_bytes
+    #
+    # Reads only remember which keys they hit; their access times are written
+    # back here, right before they matter.
+    def _evict(self):
+        db = self._db()
+        now = time.time()
+        with db:
+            db.executemany("UPDATE results SET atime = ? WHERE key = ?", [(now, key) for key in self._touched])
+            self._touched.clear()
+            self._total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if self._total <= self.max_bytes:
+                return
+            excess = self._total - 0.9*self.max_bytes
+            for key, size in db.execute("SELECT key, size FROM results ORDER BY atime").fetchall():
+                if excess <= 0:
+                    break
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.memory.pop(key, None)
+                excess -= size
+                self._total -= size
+
+    def clear(self):
+        self.memory.clear()
+        self._pending = []
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM results")
+            db.execute("DELETE FROM figures")
+        self._total = 0
+
+    # figures are rebuilt only when the key of their inputs changed
+    def figure_is_fresh(self, path, key):
+        row = self._db().execute("SELECT key FROM figures WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return row is not None and row[0] == key and os.path.exists(path)
+
+    def figure_saved(self, path, key):
+        db = self._db()
+        with db:
+            db.execute("INSERT OR REPLACE INTO figures VALUES (?, ?)", (os.path.abspath(path), key))
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
+
+def configure(directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, enabled=True):
+    global _cache, CACHE_ENABLED
+    flush()
+    _cache = ResultCache(directory, max_bytes)
+    CACHE_ENABLED = enabled
+
+# write the pending entries of this process
+def flush():
+    if _cache is not None:
+        _cache.flush()
+
+atexit.register(flush)
+
+def figure_key(plot_func, *args, **kwargs):
+    return make_key(plot_func, *args, **kwargs)
+
+def memoize(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not CACHE_ENABLED:
+            return func(*args, **kwargs)
+        cache = get_cache()
+        key = make_key(func, *args, **kwargs)
+        hit, value = cache.get(key)
+        if not hit:
+            start = time.perf_counter()
+            value = func(*args, **kwargs)
+            cache.put(key, value, persist=time.perf_counter() - start >= CACHE_MIN_SECONDS)
+        return value
+    return wrapper
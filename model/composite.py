@@ -0,0 +1,125 @@
+import numpy as np
+
+from binomial import logsumexp
+from ramp import bch_n, complete_replication, erasure_coding, log_p_b_vec, log_p_chipkill_vec
+
+# HETEROGENEOUS COMPOSITE SCHEMES
+#
+# erasure_coding and complete_replication assume that every fragment fails
+# with the same probability. Here a scheme is a tree: the leaves are lower-tier
+# protected memories, each with its own cache line failure probability, and
+# every inner node spreads a block over its children and needs k of them, so
+# that e.g. chipkill under EC under replication is
+#
+#   replicated([erasure_coded([chipkill_tier(k, t, rber) for rber in rbers], 4), ...])
+#
+# Every node answers two questions for a block of b bytes: the log
+# probability that reading it fails, and the expected number of leaf reads
+# beyond the minimum. The number of failed children follows a Poisson-binomial
+# distribution, which is built one child at a time in O(n^2) rather than by
+# enumerating subsets.
+#
+# As in erasure_coding, the DUE of a node charges every fragment the full
+# block size while the reads charge the fragment size b/k, so a homogeneous
+# tree reproduces the scheme classes (see from_scheme). The only difference is
+# that a read which ends in a DUE still counts the reads it made, where the
+# scheme classes count none; a_r differs by a term of the order of p_due.
+
+class _node:
+    def p_due(self, b):
+        return np.exp(self.log_p_fail(b)[0])
+
+    def a_r(self, b):
+        return self.reads(b)[1]
+
+# lower-tier protected memory whose cache lines of c bytes fail with
+# probability p_c
+class lower_tier(_node):
+    def __init__(self, p_c, c=64):
+        self.p_c = p_c
+        self.c = c
+
+    # log of the probability that reading b bytes fails and of its complement
+    def log_p_fail(self, b):
+        return log_p_b_vec(b, self.c, self.p_c)
+
+    # (minimal reads, expected extra reads)
+    def reads(self, b):
+        return 1, np.zeros(np.shape(self.p_c))
+
+def chipkill_tier(k, t, rber, c=64, approximate=True):
+    n = bch_n(k, t)
+    return lower_tier(np.exp(log_p_chipkill_vec(n, k, t, rber, approximate=approximate)), c)
+
+# a block split into k fragments over the children, any k of which rebuild it
+class k_of_n(_node):
+    def __init__(self, children, k):
+        if not 1 <= k <= len(children):
+            raise ValueError(f"need 1 <= k <= {len(children)}, got {k}")
+        self.children = list(children)
+        self.k = k
+        self.m = len(children) - k
+
+    def log_p_fail(self, b):
+        log_p, log_q = zip(*[child.log_p_fail(b) for child in self.children])
+        log_p = _log_range(_failure_pmfs(log_p, log_q)[-1], self.m+1, len(self.children)+1)
+        # a certain failure may round to slightly above log 1
+        log_p = np.minimum(log_p, 0.)
+        with np.errstate(divide='ignore'):
+            return log_p, np.log(-np.expm1(log_p))
+
+    # Children are read in order until k of them succeed or more than m have
+    # failed. Child i is read with probability P[F_i in [i-k+1, m]], where F_i
+    # is the number of failures among the first i children. For i < k that is
+    # 1 - P[F_i > m]; the extra reads are written so that the k minimal reads
+    # cancel analytically and the result keeps its relative precision.
+    def reads(self, b):
+        fragment = np.asarray(b, dtype=float) / self.k
+        log_p, log_q = zip(*[child.log_p_fail(fragment) for child in self.children])
+        pmfs = _failure_pmfs(log_p, log_q)
+        minimal = 0
+        a_r = 0.
+        for i, child in enumerate(self.children):
+            child_min, child_a_r = child.reads(fragment)
+            if i < self.k:
+                minimal += child_min
+                a_r = a_r + child_a_r - np.exp(_log_range(pmfs[i], self.m+1, i+1)) * (child_min + child_a_r)
+            else:
+                a_r = a_r + np.exp(_log_range(pmfs[i], i-self.k+1, self.m+1)) * (child_min + child_a_r)
+        return minimal, a_r
+
+def erasure_coded(children, k):
+    return k_of_n(children, k)
+
+def replicated(children):
+    return k_of_n(children, 1)
+
+# log pmfs of the number of failures among the first i children, i = 0..n,
+# each of shape (i+1,) + the broadcast shape of the probabilities
+def _failure_pmfs(log_p, log_q):
+    shape = np.broadcast_shapes(*[np.shape(x) for x in log_p + log_q])
+    pmf = np.zeros((1,) + shape)
+    pmfs = [pmf]
+    for lp, lq in zip(log_p, log_q):
+        new = np.full((len(pmf)+1,) + shape, -np.inf)
+        new[:-1] = pmf + lq
+        new[1:] = np.logaddexp(new[1:], pmf + lp)
+        pmf = new
+        pmfs.append(pmf)
+    return pmfs
+
+# log P[lo <= F < hi] from the log pmf of F
+def _log_range(pmf, lo, hi):
+    lo = max(lo, 0)
+    hi = min(hi, len(pmf))
+    if lo >= hi:
+        return np.full(pmf.shape[1:], -np.inf)
+    return logsumexp(pmf[lo:hi], axis=0)
+
+# the homogeneous tree equivalent to a scheme of ramp.py over one lower tier
+def from_scheme(replication_scheme, tier):
+    if isinstance(replication_scheme, erasure_coding):
+        return k_of_n([tier] * replication_scheme.n_replicas, replication_scheme.k_replicas)
+    if isinstance(replication_scheme, complete_replication):
+        return replicated([tier] * replication_scheme.n_replicas)
+    raise TypeError(f"unsupported scheme {type(replication_scheme).__name__}")
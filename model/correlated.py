@@ -0,0 +1,183 @@
+import itertools
+import math
+import numpy as np
+
+from composite import k_of_n, lower_tier
+from ramp import erasure_coding
+
+# CORRELATED NODE AND RACK FAILURES
+#
+# The scheme classes assume that the fragments of a block fail independently.
+# Here the fragments of a coding group live on nodes of a cluster, and whole
+# nodes or racks go down together, as the CodingSets placement of Hydra is
+# designed for. A cluster is an array racks with the rack of every node, and a
+# placement is an integer array of shape (groups, n) with the nodes of every
+# coding group.
+#
+# A failure model yields the states of one group exactly: a probability and
+# the probability that each of its nodes is down. On top of that, the
+# fragments on live nodes fail from bit errors as in the scheme classes, so
+# evaluate_placement gives the DUE, the probability of a degraded read (one
+# of the first k fragments is unavailable) and the expected extra reads per
+# block, averaged over groups. Groups with the same shape relative to the
+# racks share one evaluation.
+#
+# Whether any group of a placement loses data when nodes fail is a property
+# of the placement as a whole; p_any_loss estimates it by sampling, with the
+# same failure samples for every candidate placement, so that thousands of
+# placements can be ranked without the noise of independent samples.
+
+# independent failures of every node with probability p_node and of every
+# rack, which takes all of its nodes down, with probability p_rack
+class node_rack_failures:
+    def __init__(self, p_node, p_rack=0.):
+        self.p_node = p_node
+        self.p_rack = p_rack
+
+    def signature(self, group, racks):
+        labels = {}
+        return tuple(labels.setdefault(r, len(labels)) for r in racks[group].tolist())
+
+    def group_states(self, group, racks):
+        group_racks = self.signature(group, racks)
+        spanned = max(group_racks) + 1
+        for down in itertools.product((False, True), repeat=spanned):
+            weight = math.prod(self.p_rack if d else 1 - self.p_rack for d in down)
+            if weight > 0:
+                yield weight, [1. if down[r] else self.p_node for r in group_racks]
+
+    def sample(self, rng, racks, size):
+        rack_down = rng.random((size, int(racks.max()) + 1)) < self.p_rack
+        return rack_down[:, racks] | (rng.random((size, len(racks))) < self.p_node)
+
+# f nodes, chosen uniformly, fail at the same time, as after a power outage;
+# the failure model under which copysets and CodingSets are usually compared
+class simultaneous_failures:
+    def __init__(self, f):
+        self.f = f
+
+    def signature(self, group, racks):
+        return len(group)
+
+    def group_states(self, group, racks):
+        n = len(group)
+        nodes = len(racks)
+        for j in range(0, min(n, self.f) + 1):
+            # hypergeometric probability that j of the failed nodes are in the group
+            weight = math.comb(n, j) * math.comb(nodes - n, self.f - j) / math.comb(nodes, self.f)
+            if weight == 0:
+                continue
+            for down in itertools.combinations(range(n), j):
+                yield weight / math.comb(n, j), [1. if i in down else 0. for i in range(n)]
+
+    def sample(self, rng, racks, size):
+        nodes = len(racks)
+        chosen = np.argpartition(rng.random((size, nodes)), self.f, axis=1)[:, :self.f]
+        failed = np.zeros((size, nodes), dtype=bool)
+        np.put_along_axis(failed, chosen, True, axis=1)
+        return failed
+
+# a fragment on a node that is down with probability p_down, whose cache
+# lines otherwise fail with probability p_c
+class _fragment(lower_tier):
+    def __init__(self, p_down, p_c, c):
+        super().__init__(p_c, c)
+        self.p_down = p_down
+
+    def log_p_fail(self, b):
+        log_p, log_q = super().log_p_fail(b)
+        with np.errstate(divide='ignore'):
+            log_q = log_q + math.log1p(-self.p_down) if self.p_down < 1 else np.full(np.shape(log_q), -np.inf)
+            return np.log(-np.expm1(log_q)), log_q
+
+def _k(replication_scheme):
+    return replication_scheme.k_replicas if isinstance(replication_scheme, erasure_coding) else 1
+
+# DUE, degraded read probability and extra reads of one group
+def group_metrics(replication_scheme, group, racks, failures, b, c, p_c):
+    k = _k(replication_scheme)
+    p_due = p_degraded = a_r = 0.
+    for weight, p_down in failures.group_states(group, racks):
+        fragments = [_fragment(p, p_c, c) for p in p_down]
+        tree = k_of_n(fragments, k)
+        p_due += weight * float(tree.p_due(b))
+        a_r += weight * float(tree.a_r(b))
+        log_q_first = sum(float(f.log_p_fail(b / k)[1]) for f in fragments[:k])
+        p_degraded += weight * -math.expm1(log_q_first)
+    return {'p_due': p_due, 'p_degraded': p_degraded, 'a_r': a_r}
+
+# group_metrics averaged over the groups of a placement, with blocks spread
+# evenly over the groups
+def evaluate_placement(replication_scheme, placement, racks, failures, b, c, p_c, memo=None):
+    placement = np.asarray(placement)
+    racks = np.asarray(racks)
+    memo = {} if memo is None else memo
+    totals = {'p_due': 0., 'p_degraded': 0., 'a_r': 0.}
+    for group in placement:
+        key = failures.signature(group, racks)
+        if key not in memo:
+            memo[key] = group_metrics(replication_scheme, group, racks, failures, b, c, p_c)
+        for name, value in memo[key].items():
+            totals[name] += value
+    return {name: value / len(placement) for name, value in totals.items()}
+
+# probability that node failures alone leave some group of each placement
+# with more than m failed fragments, and its standard error
+def p_any_loss(placements, racks, m, failures, samples=10**5, seed=None, chunk=8192):
+    rng = np.random.default_rng(seed)
+    racks = np.asarray(racks)
+    # failed fragments per group as one matrix product with the node-group
+    # incidence matrix of every placement; groups on the same nodes count once
+    incidence = []
+    for placement in placements:
+        placement = np.unique(np.sort(np.asarray(placement), axis=1), axis=0)
+        a = np.zeros((len(racks), len(placement)), dtype=np.float32)
+        np.add.at(a, (placement, np.arange(len(placement))[:, None]), 1)
+        incidence.append(a)
+    losses = np.zeros(len(incidence))
+    for i in range(0, samples, chunk):
+        failed = failures.sample(rng, racks, min(chunk, samples - i)).astype(np.float32)
+        for j, a in enumerate(incidence):
+            losses[j] += np.count_nonzero((failed @ a > m).any(axis=1))
+    p = losses / samples
+    return p, np.sqrt(p * (1 - p) / samples)
+
+# CLUSTERS AND PLACEMENTS
+
+def uniform_racks(racks, nodes_per_rack):
+    return np.repeat(np.arange(racks), nodes_per_rack)
+
+# n nodes per group chosen at random, on n distinct racks when rack_aware
+def random_placement(racks, n, groups, rng, rack_aware=True):
+    racks = np.asarray(racks)
+    by_rack = [np.flatnonzero(racks == r) for r in np.unique(racks)]
+    if rack_aware and n > len(by_rack):
+        raise ValueError(f"a group of {n} nodes cannot span distinct racks out of {len(by_rack)}")
+    placement = np.empty((groups, n), dtype=int)
+    for g in range(groups):
+        if rack_aware:
+            placement[g] = [rng.choice(by_rack[r]) for r in rng.choice(len(by_rack), n, replace=False)]
+        else:
+            placement[g] = rng.choice(len(racks), n, replace=False)
+    return placement
+
+# disjoint coding sets of n nodes on distinct racks, covering the cluster as
+# far as it divides
+def coding_sets(racks, n, rng):
+    racks = np.asarray(racks)
+    queues = [list(rng.permutation(np.flatnonzero(racks == r))) for r in np.unique(racks)]
+    sets = []
+    while True:
+        available = sorted(range(len(queues)), key=lambda r: -len(queues[r]))[:n]
+        if len(available) < n or not queues[available[-1]]:
+            return np.array(sets, dtype=int).reshape(-1, n)
+        sets.append([queues[r].pop() for r in available])
+
+# CodingSets placement: every group is one of the disjoint coding sets, so
+# that few distinct node combinations hold data and fewer simultaneous
+# failures destroy a group. Groups are spread over the sets evenly.
+def codingsets_placement(racks, n, groups, rng):
+    sets = coding_sets(racks, n, rng)
+    if len(sets) == 0:
+        raise ValueError(f"the cluster has fewer than {n} racks with free nodes")
+    return sets[rng.permutation(groups) % len(sets)]
@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import numpy as np
+
+# COLUMNAR EXPORT OF SWEEP RESULTS
+#
+# A result set is a directory with one .npy file per field of the record
+# dtype and a metadata.json that holds the dtype, the row count and the sweep
+# parameters. Chunks are appended to raw column files as they arrive, so the
+# writer needs memory for one chunk only; close() prefixes every column with
+# its .npy header. Readers memory-map the columns instead of parsing text:
+#
+#   columns, metadata = open_columns("sweep")
+#   columns['p_due'][columns['t'] == 10]
+
+class ColumnWriter:
+    def __init__(self, path, dtype, metadata=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.metadata = metadata if metadata is not None else {}
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        self.files = {name: open(self._raw(name), 'wb') for name in self.dtype.names}
+
+    def _raw(self, name):
+        return os.path.join(self.path, f"{name}.raw")
+
+    def write(self, chunk):
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        for name, fo in self.files.items():
+            fo.write(np.ascontiguousarray(chunk[name]).tobytes())
+        self.rows += len(chunk)
+
+    def close(self):
+        for name, fo in self.files.items():
+            fo.close()
+            field = self.dtype[name]
+            with open(os.path.join(self.path, f"{name}.npy"), 'wb') as out:
+                np.lib.format.write_array_header_2_0(out, {'descr': np.lib.format.dtype_to_descr(field), 'fortran_order': False, 'shape': (self.rows,)})
+                with open(self._raw(name), 'rb') as raw:
+                    shutil.copyfileobj(raw, out, 16*1024*1024)
+            os.remove(self._raw(name))
+        with open(os.path.join(self.path, "metadata.json"), 'w') as fo:
+            json.dump({'rows': self.rows, 'dtype': self.dtype.descr, 'parameters': self.metadata}, fo, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# write the chunks yielded by a sweep and return the number of rows
+def write_columns(path, chunks, dtype, metadata=None):
+    with ColumnWriter(path, dtype, metadata) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return writer.rows
+
+# memory-mapped columns and the metadata of a result set
+def open_columns(path):
+    with open(os.path.join(path, "metadata.json")) as fo:
+        metadata = json.load(fo)
+    names = [field[0] for field in metadata['dtype']]
+    columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in names}
+    return columns, metadata
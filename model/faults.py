@@ -0,0 +1,120 @@
+import numpy as np
+
+# SPATIALLY CORRELATED DRAM FAULTS
+#
+# p_b assumes that the cache lines of a block fail independently, each with
+# probability p_c. Field studies of DRAM instead find most errors in faults of
+# whole rows, columns, banks or chips, which hit many lines of the same page
+# at once. dram_faults keeps the independent line failures p_c of the lower
+# tier and adds fault modes on top of them; it is passed to the scheme
+# classes in place of p_c:
+#
+#   faults = dram_faults(p_c, FIELD_MODES)
+#   erasure_coding(6, 4).p_due(4096, 64, faults)
+#
+# A fault mode has a rate in FIT (failures per 10^9 hours) per DRAM device
+# and the probability that a cache line it covers becomes uncorrectable,
+# which is well below 1 for a lower tier such as chipkill that corrects a
+# whole device. A line is spread over all chips of the rank, so the row
+# (column, bank) of the rank is faulty when the row of any of its chips is.
+# Faults are present for hours, the time until a faulty page is retired or
+# a faulty DIMM replaced.
+#
+# Blocks are laid out on consecutive lines of a rank row and consecutive rows
+# interleave over the banks. A block therefore touches a known number of
+# rows, columns and banks, and since faults of different instances are
+# independent, the probability that no line of the block fails factorizes
+# over them: the log of the complement is the sum over modes of the number of
+# instances the block touches times the log of the probability that one such
+# instance spares all of its lines. This is the zero term of the convolution
+# of the failed-line counts of all modes and costs a few array operations per
+# call, for arrays of b and p_c alike.
+
+FIT_HOURS = 1E9
+
+SCOPES = ('row', 'column', 'bank', 'rank')
+
+class dram_layout:
+    def __init__(self, row_bytes=8192, rows_per_bank=65536, banks=16, chips=18):
+        self.row_bytes = row_bytes
+        self.rows_per_bank = rows_per_bank
+        self.banks = banks
+        self.chips = chips
+
+    # instances of scope in the rank
+    def instances(self, scope, c):
+        return {
+            'row': self.banks * self.rows_per_bank,
+            'column': self.banks * (self.row_bytes // np.asarray(c)),
+            'bank': self.banks,
+            'rank': 1,
+        }[scope]
+
+    # (instances the block touches, lines each of them covers) per scope,
+    # as lists of (count, lines) pairs of arrays that broadcast with b; blocks
+    # start at a row boundary and are shorter than a row or whole rows
+    def footprint(self, b, c):
+        lines = np.ceil(np.asarray(b, dtype=float) / c)
+        per_row = self.row_bytes // np.asarray(c)
+        in_row = np.minimum(lines, per_row)
+        rows = np.ceil(lines / per_row)
+        banks = np.minimum(rows, self.banks)
+        # rows spread over banks as evenly as possible: `more` banks hold one
+        # row more than the others
+        fewer = np.floor(rows / banks)
+        more = rows - banks * fewer
+        return {
+            'row': [(rows, in_row)],
+            'column': [(more * in_row, fewer + 1), ((banks - more) * in_row, fewer)],
+            'bank': [(more, (fewer + 1) * in_row), (banks - more, fewer * in_row)],
+            'rank': [(np.ones_like(lines), lines)],
+        }
+
+class fault_mode:
+    def __init__(self, scope, fit, p_uncorrectable=1.):
+        if scope not in SCOPES:
+            raise ValueError(f"unknown fault scope '{scope}', expected one of {', '.join(SCOPES)}")
+        self.scope = scope
+        self.fit = fit
+        self.p_uncorrectable = p_uncorrectable
+
+# per-device rates of permanent faults of the order field studies of DDR3
+# report; device-wide faults count as rank faults. Chipkill corrects a single
+# faulty device, so a line these faults cover fails only when a second device
+# errs as well, here taken to happen once in 10^4 lines.
+FIELD_MODES = [
+    fault_mode('row', 8.2, 1E-4),
+    fault_mode('column', 5.6, 1E-4),
+    fault_mode('bank', 10.0, 1E-4),
+    fault_mode('rank', 4.2, 1E-4),
+]
+
+class dram_faults:
+    def __init__(self, p_c, modes, layout=None, hours=24*30):
+        self.p_c = p_c
+        self.modes = list(modes)
+        self.layout = dram_layout() if layout is None else layout
+        self.hours = hours
+
+    # probability that one instance of the mode's scope is faulty
+    def p_instance(self, mode, c):
+        rate = self.layout.chips * mode.fit / FIT_HOURS / self.layout.instances(mode.scope, c)
+        return -np.expm1(-rate * self.hours)
+
+    # log of the probability that reading b bytes fails and of its
+    # complement, as ramp.log_p_b_vec
+    def log_p_b(self, b, c):
+        p_c = np.asarray(self.p_c, dtype=float)
+        footprint = self.layout.footprint(b, c)
+        with np.errstate(divide='ignore'):
+            log_q = footprint['rank'][0][1] * np.log1p(-p_c)
+            for mode in self.modes:
+                p = self.p_instance(mode, c)
+                log_spared = np.log1p(-mode.p_uncorrectable)
+                for count, covered in footprint[mode.scope]:
+                    # P[a faulty instance makes some of its covered lines fail]
+                    with np.errstate(invalid='ignore'):
+                        hit = -np.expm1(np.where(covered > 0, covered * log_spared, 0.))
+                    log_q = log_q + count * np.log1p(-p * hit)
+            log_p = np.log(-np.expm1(log_q))
+        return log_p, log_q
@@ -0,0 +1,188 @@
+import argparse
+import bisect
+import functools
+import json
+import math
+import os
+import numpy as np
+
+import cache
+import nde
+from ramp import K, bch_n, log_p_chipkill_vec, parse_scheme, scheme_name
+from sweep import run_sweep
+
+# PRECOMPUTED LOOKUP TABLES
+#
+# A table is a directory holding dense grids of the model over rber x t, and
+# over scheme x block size x t x rber for the upper-tier quantities, as
+# natural logarithms in .npy files, plus a metadata.json with the axes:
+#
+#   log_p_chipkill.npy  (t, rber)
+#   log_p_nde.npy       (t, rber)
+#   log_p_due.npy       (scheme, b, t, rber)
+#   log_a_r.npy         (scheme, b, t, rber), of |a_r|
+#   sign_a_r.npy        (scheme, b, t, rber), negative without an upper tier
+#
+# The files are memory-mapped, so every process shares the page cache instead
+# of loading its own copy. rber is log-spaced and the quantities are
+# interpolated linearly in log rber and log value, on which they are close
+# to straight lines; t, scheme and b must be points of the grid. The error
+# estimate is the difference to the quadratic through the nearest third grid
+# point.
+#
+#   python3 lookup.py build --t 0:40 --scheme none rep:3 ec:6:4 --b 64 4096
+#   python3 lookup.py query --rber 3e-4 --t 10 --scheme ec:6:4 --b 4096
+
+# generated data, kept next to the result cache rather than in the source tree
+LOOKUP_TABLE = os.environ.get("RAMP_LOOKUP_TABLE", os.path.join(cache.CACHE_DIR, "lookup"))
+
+QUANTITIES = ('p_chipkill', 'p_nde', 'p_due', 'a_r')
+
+# grids of one t, shape (rber,) and (scheme, b, rber)
+def _build_t(k, t, rbers, schemes, bb, c, approximate):
+    n = bch_n(k, t)
+    log_p_c = log_p_chipkill_vec(n, k, t, rbers, approximate=approximate)
+    log_p_nde = nde.log_p_nde_bch(n, t, rbers) if 2*t < n else np.full(len(rbers), -np.inf)
+    p_c = np.exp(log_p_c)
+    b = np.asarray(bb, dtype=float)[:, None]
+    log_p_due = np.stack([s.log_p_due_vec(b, c, p_c[None, :]) for s in schemes])
+    a_r = np.stack([np.broadcast_to(s.a_r_vec(b, c, p_c[None, :]), (len(bb), len(rbers))) for s in schemes])
+    with np.errstate(divide='ignore'):
+        log_a_r = np.log(np.abs(a_r))
+    return log_p_c, log_p_nde, log_p_due, log_a_r, np.sign(a_r).astype(np.int8)
+
+def build(path, tt, rbers, schemes, bb, k=K, c=64, approximate=True, processes=None):
+    tt = list(tt)
+    rbers = np.sort(np.asarray(rbers, dtype=float))
+    schemes = [parse_scheme(s) if isinstance(s, str) else s for s in schemes]
+    grids = run_sweep(_build_t, [(k, t, rbers, schemes, bb, c, approximate) for t in tt], processes=processes)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "log_p_chipkill.npy"), np.stack([g[0] for g in grids]))
+    np.save(os.path.join(path, "log_p_nde.npy"), np.stack([g[1] for g in grids]))
+    np.save(os.path.join(path, "log_p_due.npy"), np.stack([g[2] for g in grids], axis=2))
+    np.save(os.path.join(path, "log_a_r.npy"), np.stack([g[3] for g in grids], axis=2))
+    np.save(os.path.join(path, "sign_a_r.npy"), np.stack([g[4] for g in grids], axis=2))
+    with open(os.path.join(path, "metadata.json"), 'w') as fo:
+        json.dump({'k': k, 'c': c, 'approximate': approximate, 'rber': rbers.tolist(), 't': tt,
+            'scheme': [scheme_name(s) for s in schemes], 'b': list(bb)}, fo, indent=2)
+    _open_table.cache_clear()
+
+# rbers from lo to hi with per_decade points per decade
+def log_grid(lo, hi, per_decade):
+    decades = math.log10(hi / lo)
+    return np.logspace(math.log10(lo), math.log10(hi), int(round(decades * per_decade)) + 1)
+
+class lookup_table:
+    def __init__(self, path=LOOKUP_TABLE):
+        with open(os.path.join(path, "metadata.json")) as fo:
+            self.metadata = json.load(fo)
+        self.log_rber = [math.log(r) for r in self.metadata['rber']]
+        self.t = {t: i for i, t in enumerate(self.metadata['t'])}
+        self.scheme = {s: i for i, s in enumerate(self.metadata['scheme'])}
+        self.b = {b: i for i, b in enumerate(self.metadata['b'])}
+        # plain ndarray views of the maps, which index faster than np.memmap
+        self.arrays = {name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+            for name in ('log_p_chipkill', 'log_p_nde', 'log_p_due', 'log_a_r', 'sign_a_r')}
+
+    def _index(self, axis, value):
+        try:
+            return getattr(self, axis)[value]
+        except KeyError:
+            raise ValueError(f"{axis}={value} is not in the table, which has {list(getattr(self, axis))}") from None
+
+    def _row(self, quantity, t, scheme, b):
+        ti = self._index('t', t)
+        if quantity in ('p_chipkill', 'p_nde'):
+            return self.arrays['log_' + quantity][ti], None
+        si = self._index('scheme', _normalize(scheme) if isinstance(scheme, str) else scheme_name(scheme))
+        bi = self._index('b', b)
+        sign = self.arrays['sign_a_r'][si, bi, ti] if quantity == 'a_r' else None
+        return self.arrays['log_' + quantity][si, bi, ti], sign
+
+    # (value, estimated relative error) of quantity at rber, by interpolation
+    def query(self, quantity, rber, t, scheme='none', b=4096):
+        if quantity not in QUANTITIES:
+            raise ValueError(f"unknown quantity '{quantity}', expected one of {', '.join(QUANTITIES)}")
+        row, sign = self._row(quantity, t, scheme, b)
+        xs = self.log_rber
+        x = math.log(rber)
+        if not xs[0] <= x <= xs[-1]:
+            raise ValueError(f"rber={rber} is outside the table range [{self.metadata['rber'][0]}, {self.metadata['rber'][-1]}]")
+        i = min(max(bisect.bisect_right(xs, x) - 1, 0), len(xs) - 2)
+        y0 = float(row[i])
+        y1 = float(row[i+1])
+        s = 1 if sign is None else int(sign[i if x - xs[i] <= xs[i+1] - x else i+1])
+        if not (math.isfinite(y0) and math.isfinite(y1)):
+            y = y0 if x - xs[i] <= xs[i+1] - x else y1
+            return s * math.exp(y), (0. if y0 == y1 else math.inf)
+        f = (x - xs[i]) / (xs[i+1] - xs[i])
+        y = y0 + f * (y1 - y0)
+        error = math.inf
+        j = i - 1 if i > 0 and (i + 2 >= len(xs) or x - xs[i] <= xs[i+1] - x) else i + 2
+        if 0 <= j < len(xs):
+            y2 = float(row[j])
+            if math.isfinite(y2):
+                # quadratic through the three points, in Newton form
+                d01 = (y1 - y0) / (xs[i+1] - xs[i])
+                d012 = ((y2 - y1) / (xs[j] - xs[i+1]) - d01) / (xs[j] - xs[i]) if j > i else \
+                    (d01 - (y0 - y2) / (xs[i] - xs[j])) / (xs[i+1] - xs[j])
+                error = abs(d012 * (x - xs[i]) * (x - xs[i+1]))
+        return s * math.exp(y), math.expm1(error)
+
+@functools.lru_cache(maxsize=None)
+def _normalize(spec):
+    return scheme_name(parse_scheme(spec))
+
+@functools.lru_cache(maxsize=None)
+def _open_table(path):
+    return lookup_table(path)
+
+# query the table at path, opened once per process
+def query(quantity, rber, t, scheme='none', b=4096, path=LOOKUP_TABLE):
+    return _open_table(path).query(quantity, rber, t, scheme, b)
+
+def _int_range(s):
+    fields = [int(f) for f in s.split(':')]
+    if len(fields) == 1:
+        return range(fields[0], fields[0]+1)
+    return range(*fields)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query precomputed model tables")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("build", help="precompute a table")
+    p.add_argument("--k", type=int, default=K, help="data bits per lower-tier codeword")
+    p.add_argument("--c", type=int, default=64, help="cache line size in bytes")
+    p.add_argument("--t", type=_int_range, nargs='+', default=[range(0, 41)], help="correctable bits, T or START:STOP[:STEP]")
+    p.add_argument("--rber-min", type=float, default=1E-8, help="smallest raw bit error rate")
+    p.add_argument("--rber-max", type=float, default=1E-2, help="largest raw bit error rate")
+    p.add_argument("--per-decade", type=int, default=40, help="rber grid points per decade")
+    p.add_argument("--scheme", nargs='+', default=["none", "rep:2", "rep:3", "ec:6:4", "ec:10:8"], help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=_int_range, nargs='+', default=[range(64, 65), range(4096, 4097)], help="block sizes in bytes")
+    p.add_argument("--precise", action="store_true", help="sum the full codeword failure tail")
+    p.add_argument("--output", default=LOOKUP_TABLE, help="table directory")
+
+    p = subparsers.add_parser("query", help="interpolate a table")
+    p.add_argument("--table", default=LOOKUP_TABLE, help="table directory")
+    p.add_argument("--quantity", nargs='+', default=list(QUANTITIES), choices=QUANTITIES)
+    p.add_argument("--rber", type=float, required=True, help="raw bit error rate")
+    p.add_argument("--t", type=int, required=True, help="correctable bits")
+    p.add_argument("--scheme", default="none", help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=int, default=4096, help="block size in bytes")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        tt = [t for r in args.t for t in r]
+        bb = [b for r in args.b for b in r]
+        build(args.output, tt, log_grid(args.rber_min, args.rber_max, args.per_decade), args.scheme, bb,
+            k=args.k, c=args.c, approximate=not args.precise)
+        print(f"table of {len(tt)} t, {len(args.scheme)} schemes and {len(bb)} block sizes written to {args.output}")
+    else:
+        table = lookup_table(args.table)
+        for quantity in args.quantity:
+            value, error = table.query(quantity, args.rber, args.t, args.scheme, args.b)
+            print(f"{quantity} = {value:.6e} (relative error ~{error:.1e})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import math
+import statistics
+import time
+import numpy as np
+
+from binomial import log_binom_sf, log_p_q
+from ramp import P_RS, bch_n, erasure_coding, p_chipkill
+
+# MONTE CARLO VALIDATION OF THE TWO-TIER MODEL
+#
+# Simulates reads of blocks protected by chipkill in the lower tier and by
+# replication or erasure coding in the upper tier, and reports every estimate
+# with a confidence interval next to the analytic value of ramp.py.
+#
+# Fragments are laid out as the analytic model assumes: for p_due every
+# fragment spans ceil(b/c) cache lines, for a_r an erasure-coded fragment spans
+# ceil(b/k/c) lines. A cache line fails when its codeword holds more than t
+# bit errors and the RS stage then fails with probability P_RS; the analytic
+# value is therefore the precise (full tail) p_chipkill.
+#
+# simulate samples every block and reaches probabilities down to about
+# 1/blocks. simulate_importance reaches the 1e-32 region by sampling cache
+# line failures from a tilted distribution that makes the DUE event common,
+# and weighting every block by its likelihood ratio.
+
+# (fragments, fragments needed, lines per fragment for p_due, for a_r)
+def scheme_geometry(replication_scheme, b, c):
+    lines = math.ceil(b / c)
+    if isinstance(replication_scheme, erasure_coding):
+        k = replication_scheme.k_replicas
+        return replication_scheme.n_replicas, k, lines, math.ceil(b / k / c)
+    return replication_scheme.n_replicas, 1, lines, lines
+
+def _z(confidence):
+    return statistics.NormalDist().inv_cdf(0.5 + confidence/2)
+
+# Wilson score interval of a probability estimated from hits out of samples
+def _wilson(hits, samples, analytic, confidence):
+    z = _z(confidence)
+    p = hits / samples
+    denom = 1 + z*z/samples
+    center = (p + z*z/(2*samples)) / denom
+    half = z * math.sqrt(p*(1-p)/samples + z*z/(4*samples*samples)) / denom
+    return {'estimate': p, 'ci_low': max(0., center-half), 'ci_high': min(1., center+half), 'analytic': analytic, 'samples': samples}
+
+# normal interval of a mean from the running sums of x and x^2
+def _normal(s1, s2, samples, analytic, confidence):
+    mean = s1 / samples
+    var = max(0., s2/samples - mean*mean) * samples / max(1, samples-1)
+    half = _z(confidence) * math.sqrt(var / samples)
+    return {'estimate': mean, 'ci_low': mean-half, 'ci_high': mean+half, 'analytic': analytic, 'samples': samples}
+
+# bit counts sampled at once under bit_level, which bounds the chunk of
+# blocks to about 32 MB of int64 counts
+BIT_LEVEL_ELEMENTS = 2**22
+
+# number of failed cache lines in each of the given fragments
+def _failed_lines(rng, shape, lines, n, t, rber, p_line, bit_level):
+    if bit_level:
+        uncorrectable = (rng.binomial(n, rber, size=shape + (lines,)) > t).sum(axis=-1)
+        return rng.binomial(uncorrectable, P_RS)
+    return rng.binomial(lines, p_line, size=shape)
+
+# reads until `needed` good fragments are found, or 0 if there are not enough
+def _reads(good, needed):
+    found = np.cumsum(good, axis=1)
+    ok = found[:, -1] >= needed
+    return np.where(ok, np.argmax(found >= needed, axis=1) + 1, 0)
+
+def simulate(k, t, rber, replication_scheme, b, c, blocks=10**6, seed=None, chunk=2**18, bit_level=False, confidence=0.95):
+    rng = np.random.default_rng(seed)
+    n = bch_n(k, t)
+    fragments, needed, lines_due, lines_read = scheme_geometry(replication_scheme, b, c)
+    p_line = P_RS * float(np.exp(log_binom_sf(t+1, n, *log_p_q(rber))))
+    if bit_level:
+        chunk = max(1, min(chunk, BIT_LEVEL_ELEMENTS // (fragments * max(lines_due, lines_read))))
+    due = 0
+    s1 = s2 = 0.
+    start = time.perf_counter()
+    for i in range(0, blocks, chunk):
+        size = min(chunk, blocks - i)
+        failed = _failed_lines(rng, (size, fragments), lines_due, n, t, rber, p_line, bit_level) > 0
+        due += int(np.count_nonzero(failed.sum(axis=1) > fragments - needed))
+        good = _failed_lines(rng, (size, fragments), lines_read, n, t, rber, p_line, bit_level) == 0
+        reads = _reads(good, needed)
+        s1 += float(reads.sum())
+        s2 += float((reads*reads).sum())
+    elapsed = time.perf_counter() - start
+
+    p_c = p_chipkill(n, k, t, rber, approximate=False)
+    a_r = _normal(s1, s2, blocks, replication_scheme.a_r(b, c, p_c), confidence)
+    a_r['estimate'] -= needed
+    a_r['ci_low'] -= needed
+    a_r['ci_high'] -= needed
+    return {
+        'p_due': _wilson(due, blocks, replication_scheme.p_due(b, c, p_c), confidence),
+        'a_r': a_r,
+        'blocks_per_second': blocks / elapsed if elapsed > 0 else float('inf'),
+    }
+
+# DUE by importance sampling
+#
+# Cache lines fail with a tilted probability q_line instead of p_line. tilt
+# is the resulting probability that a fragment has a failed line, by default
+# such that the expected number of failed fragments equals the number that
+# causes a DUE. Every line outcome enters the likelihood ratio, which
+# therefore only depends on the total number J of failed lines of the block:
+#
+#   w = (p_line/q_line)^J ((1-p_line)/(1-q_line))^(lines-J)
+#
+# so the estimate checks the line composition of fragments and their k-of-n
+# composition down to 1e-32. The bit level is left to simulate: tilting the
+# rber of every bit of a block moves its expected number of flipped bits by
+# many standard deviations, and the weights degenerate.
+def simulate_importance(k, t, rber, replication_scheme, b, c, blocks=10**6, seed=None, chunk=2**18, tilt=None, confidence=0.95):
+    rng = np.random.default_rng(seed)
+    n = bch_n(k, t)
+    fragments, needed, lines_due, _ = scheme_geometry(replication_scheme, b, c)
+    p_line = P_RS * float(np.exp(log_binom_sf(t+1, n, *log_p_q(rber))))
+    threshold = fragments - needed + 1
+    tilt = min(0.99, threshold / fragments) if tilt is None else tilt
+    q_line = max(p_line, -math.expm1(math.log1p(-tilt) / lines_due))
+    lines = fragments * lines_due
+    log_ratio_fail = math.log(p_line) - math.log(q_line)
+    log_ratio_good = math.log1p(-p_line) - math.log1p(-q_line)
+    # weights are accumulated relative to the largest log weight seen so far,
+    # so that their squares neither underflow nor overflow
+    log_scale = None
+    s1 = s2 = 0.
+    for i in range(0, blocks, chunk):
+        size = min(chunk, blocks - i)
+        failed_lines = rng.binomial(lines_due, q_line, size=(size, fragments))
+        count = failed_lines.sum(axis=1)
+        due = (failed_lines > 0).sum(axis=1) >= threshold
+        if not due.any():
+            continue
+        log_w = count[due] * log_ratio_fail + (lines - count[due]) * log_ratio_good
+        top = float(log_w.max())
+        if log_scale is None or top > log_scale:
+            if log_scale is not None:
+                s1 *= math.exp(log_scale - top)
+                s2 *= math.exp(2 * (log_scale - top))
+            log_scale = top
+        w = np.exp(log_w - log_scale)
+        s1 += float(w.sum())
+        s2 += float((w*w).sum())
+
+    p_c = p_chipkill(n, k, t, rber, approximate=False)
+    p_due = _normal(s1, s2, blocks, replication_scheme.p_due(b, c, p_c), confidence)
+    for key in ('estimate', 'ci_low', 'ci_high'):
+        p_due[key] *= math.exp(log_scale) if log_scale is not None else 0.
+    return {'p_due': p_due}
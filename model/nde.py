@@ -0,0 +1,161 @@
+import argparse
+import functools
+import math
+import os
+import numpy as np
+
+from binomial import RTOL, log_binom_sf, log_comb, log_p_q, logsumexp
+from cache import CACHE_DIR
+
+# NON-DETECTABLE ERROR (NDE) ENGINE FOR BCH CODES
+#
+# Log-domain counterpart of the original Decimal pe and p_nde_bch, kept as
+# exact references in benchmark.py. The Decimal code recomputes every Aj and
+# binomial coefficient for each weight w; here the sphere-packing sums are
+# evaluated for whole blocks of weights at once from a shared log-factorial
+# table and cached per (n, t), since they do not depend on the bit error rate.
+# The outer sum over w is truncated once the remaining binomial tail falls
+# below rtol of the running sum.
+
+# generated data, kept next to the result cache rather than in the source tree
+P_NDE_BCH_TABLE = os.environ.get("RAMP_NDE_TABLE", os.path.join(CACHE_DIR, "p_nde_bch.npz"))
+
+# log of numer(w) = sum_s sum_j Aj(n,t,j) C(n-j, ceil((s+w-j)/2)) C(j, ceil((s-w+j)/2))
+#
+# so that pe(n, w, t) = numer(w) / C(n, w)
+def log_pe_numer(n, w, t):
+    w = np.asarray(w)
+    terms = []
+    for s in range(0, t+1):
+        for d in range(-s, s+1):
+            j = w + d
+            a = (s - d + 1) // 2
+            b = (s + d + 1) // 2
+            valid = (j >= b) & (n - j >= a)
+            jj = np.where(valid, j, b)
+            terms.append(np.where(valid, log_comb(n, jj) + log_comb(n-jj, a) + log_comb(jj, b), -np.inf))
+    return logsumexp(terms, axis=0) - t*math.log(n+1)
+
+def log_pe(n, w, t):
+    return log_pe_numer(n, w, t) - log_comb(n, w)
+
+class _PeNumerCache:
+    def __init__(self, block=64):
+        self.block = block
+        self.tables = {}
+
+    # log numer(w) for w = t+1, ..., t+count, extending the cached prefix as needed
+    def get(self, n, t, count):
+        w_max = n - t
+        count = min(count, w_max - t)
+        table = self.tables.get((n, t), np.empty(0))
+        while len(table) < count:
+            w0 = t + 1 + len(table)
+            ww = np.arange(w0, min(w0 + self.block, w_max + 1))
+            table = np.concatenate([table, log_pe_numer(n, ww, t)])
+        self.tables[(n, t)] = table
+        return table[:count]
+
+_pe_numer_cache = _PeNumerCache()
+
+# probability of non-detectable error in BCH(n, t) for bit error rate p
+#
+# p may be an array; the result has the shape of p
+def log_p_nde_bch(n, t, p, rtol=RTOL, block=64):
+    log_p, log_q = log_p_q(p)
+    acc = np.full(log_p.shape, -np.inf)
+    max_log_pe = 0.
+    w_max = n - t
+    w0 = t + 1
+    while w0 <= w_max:
+        ww = np.arange(w0, min(w0 + block, w_max + 1))
+        numer = _pe_numer_cache.get(n, t, ww[-1] - t)[w0-t-1:]
+        ww = ww.reshape((-1,) + (1,)*log_p.ndim)
+        numer = numer.reshape(ww.shape)
+        with np.errstate(invalid='ignore'):
+            terms = numer + ww*log_p + (n-ww)*log_q
+        acc = np.logaddexp(acc, logsumexp(terms, axis=0))
+        max_log_pe = max(max_log_pe, float(np.max(numer - log_comb(n, ww))))
+        w0 = int(ww.flat[-1]) + 1
+        # every remaining term is at most pe times a binomial term
+        log_rest = log_binom_sf(w0, n, log_p, log_q) + max_log_pe
+        with np.errstate(invalid='ignore'):
+            if np.all((log_rest - acc <= math.log(rtol)) | (acc == -np.inf)):
+                break
+    return acc
+
+def p_nde_bch(n, t, p, rtol=RTOL):
+    return np.exp(log_p_nde_bch(n, t, p, rtol=rtol))
+
+# PRECOMPUTED TABLES
+#
+# A table holds p_nde_bch for every combination of codeword length n,
+# correctable bits t < n/2 and bit error rate p of a sweep, and is stored as
+# an npz file with the flat arrays n, t, p and p_nde.
+
+def generate_p_nde_bch_table(nn, tt, pp, path=P_NDE_BCH_TABLE, extend=True):
+    entries = _load_table(path) if extend and os.path.exists(path) else {}
+    pp = np.asarray(pp, dtype=float)
+    for n in nn:
+        for t in tt:
+            if 2*t >= n:
+                continue
+            missing = [p for p in pp if (n, t, float(p)) not in entries]
+            if not missing:
+                continue
+            for p, v in zip(missing, p_nde_bch(n, t, np.asarray(missing))):
+                entries[(n, t, float(p))] = float(v)
+    keys = sorted(entries)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(path,
+        n=np.array([key[0] for key in keys], dtype=int),
+        t=np.array([key[1] for key in keys], dtype=int),
+        p=np.array([key[2] for key in keys], dtype=float),
+        p_nde=np.array([entries[key] for key in keys], dtype=float))
+    _load_table.cache_clear()
+    return entries
+
+@functools.lru_cache(maxsize=None)
+def _load_table(path):
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        return {(int(n), int(t), float(p)): float(v) for n, t, p, v in zip(data['n'], data['t'], data['p'], data['p_nde'])}
+
+# identifies the contents of the table, for the keys of results drawn from it
+def table_version(path=P_NDE_BCH_TABLE):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# p_nde_bch from the precomputed table, evaluating and remembering it if missing
+def p_nde_bch_lookup(n, t, p, path=P_NDE_BCH_TABLE):
+    table = _load_table(path)
+    key = (n, t, float(p))
+    if key not in table:
+        table[key] = float(p_nde_bch(n, t, p))
+    return table[key]
+
+def _int_range(s):
+    fields = [int(f) for f in s.split(':')]
+    if len(fields) == 1:
+        return range(fields[0], fields[0]+1)
+    return range(*fields)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the precomputed p_nde_bch table")
+    parser.add_argument("--n", type=_int_range, nargs='+', required=True, help="codeword lengths, N or START:STOP[:STEP]")
+    parser.add_argument("--t", type=_int_range, nargs='+', required=True, help="correctable bits, T or START:STOP[:STEP]")
+    parser.add_argument("--rber", type=float, nargs='+', default=[2*10**-4], help="raw bit error rates")
+    parser.add_argument("--output", default=P_NDE_BCH_TABLE, help="table file")
+    parser.add_argument("--rebuild", action="store_true", help="discard the existing table instead of extending it")
+    args = parser.parse_args()
+    nn = [n for r in args.n for n in r]
+    tt = [t for r in args.t for t in r]
+    entries = generate_p_nde_bch_table(nn, tt, args.rber, path=args.output, extend=not args.rebuild)
+    print(f"{len(entries)} entries written to {args.output}")
+
+if __name__ == "__main__":
+    main()
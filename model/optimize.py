@@ -0,0 +1,122 @@
+import heapq
+import math
+import numpy as np
+
+from ramp import (bch_n, erasure_coding, log_p_chipkill_vec, p_nde_chipkill,
+    scheme_name, solve_min_t, storage_overhead)
+
+# DESIGN-SPACE OPTIMIZER
+#
+# Searches the lower-tier data bits k and strength t together with the
+# upper-tier scheme and the block size b for configurations that meet a DUE
+# target, an optional NDE target and an optional bound on the extra reads
+# a_r, and returns the Pareto frontier of total storage overhead (lower tier
+# times upper tier), a_r and block size. Small blocks always lower DUE and
+# a_r in the model, so larger blocks only make the frontier as an objective
+# of their own: they amortize the per-request cost the model does not see.
+# With upper_tier=False the overhead is that of the lower tier alone, as in
+# the plots, for upper tiers that exist for availability anyway.
+#
+# The search relies on monotonicity instead of enumerating the grid:
+#
+# - the minimal t that meets the DUE target comes from the batch solver, and
+#   the minimal t that meets the NDE target is shared by all upper tiers, so
+#   every family (k, scheme, b) starts at its first feasible t;
+# - within a family the overhead grows with t while a_r shrinks, so families
+#   are advanced in order of overhead from one heap; once a point has a_r at
+#   or below a_r_floor, which counts as no extra reads, every later point
+#   with no larger block is dominated and its family is dropped.
+#
+# p_chipkill is computed once per (k, t) and shared by all families.
+
+# storage of the upper tier relative to the data
+def upper_tier_factor(replication_scheme):
+    if isinstance(replication_scheme, erasure_coding):
+        return replication_scheme.n_replicas / replication_scheme.k_replicas
+    return replication_scheme.n_replicas
+
+# storage overhead in percent of the chipkill codewords replicated or coded
+# by the upper tier
+def total_storage_overhead(n, k, replication_scheme):
+    return ((1 + storage_overhead(n, k) / 100) * upper_tier_factor(replication_scheme) - 1) * 100
+
+# minimal t in [0, t_max] whose NDE probability is at most target, or None;
+# p_nde decreases with t
+def min_t_nde(k, rber, target, t_max):
+    for t in range(0, t_max+1):
+        if p_nde_chipkill(bch_n(k, t), t, rber) <= target:
+            return t
+    return None
+
+def optimize(rber, kk, schemes, bb, c=64, uber=1E-32, nde=None, a_r_max=None, t_max=64, a_r_floor=1E-12,
+             upper_tier=True, approximate=True):
+    log_p_c = {}
+
+    def overhead(k, t, s):
+        n = bch_n(k, t)
+        return total_storage_overhead(n, k, s) if upper_tier else storage_overhead(n, k)
+
+    def p_c(k, t):
+        if (k, t) not in log_p_c:
+            log_p_c[(k, t)] = float(log_p_chipkill_vec(bch_n(k, t), k, t, rber, approximate=approximate))
+        return math.exp(log_p_c[(k, t)])
+
+    heap = []
+    for k in kk:
+        t_nde = 0 if nde is None else min_t_nde(k, rber, nde, t_max)
+        if t_nde is None:
+            continue
+        families = [(s, b) for s in schemes for b in bb]
+        solved = solve_min_t(k, [(rber, s, b, c, uber) for s, b in families], approximate=approximate, max_t=t_max)
+        for (s, b), (t_due, n, v) in zip(families, solved):
+            if t_due is None:
+                continue
+            t = max(t_due, t_nde)
+            if t <= t_max:
+                heapq.heappush(heap, (overhead(k, t, s), len(heap), k, t, s, b))
+
+    points = []
+    # smallest overhead with negligible a_r reached so far, per block size
+    floor = {}
+    while heap:
+        v, tie, k, t, s, b = heapq.heappop(heap)
+        if any(b2 >= b and v2 <= v for b2, v2 in floor.items()):
+            continue
+        n = bch_n(k, t)
+        a_r = s.a_r(b, c, p_c(k, t))
+        if a_r_max is None or a_r <= a_r_max:
+            points.append({'k': k, 'n': n, 't': t, 'scheme': s, 'b': b, 'objective': v,
+                'total_storage_overhead': total_storage_overhead(n, k, s), 'a_r': a_r})
+            if a_r <= a_r_floor:
+                floor[b] = min(floor.get(b, math.inf), v)
+                continue
+        if t < t_max:
+            heapq.heappush(heap, (overhead(k, t+1, s), tie, k, t+1, s, b))
+
+    frontier = pareto_frontier(points, a_r_floor)
+    for point in frontier:
+        pc = p_c(point['k'], point['t'])
+        point.update({
+            'p_c': pc,
+            'p_due': point['scheme'].p_due(point['b'], c, pc),
+            'p_nde': p_nde_chipkill(point['n'], point['t'], rber),
+            'storage_overhead': storage_overhead(point['n'], point['k']),
+            'scheme': scheme_name(point['scheme']),
+            'rber': rber,
+            'c': c,
+        })
+    return frontier
+
+# points not dominated in (objective, a_r, -b), where the objective is the
+# storage overhead optimize minimizes; a_r at or below a_r_floor counts as zero
+def pareto_frontier(points, a_r_floor=0.):
+    keys = np.array([[p['objective'], max(p['a_r'], a_r_floor), -p['b']] for p in points]).reshape(-1, 3)
+    order = np.lexsort(keys.T[::-1])
+    kept = []
+    for i in order:
+        if kept:
+            others = keys[kept]
+            if np.any(np.all(others <= keys[i], axis=1)):
+                continue
+        kept.append(i)
+    return [points[i] for i in sorted(kept, key=lambda i: (keys[i][0], keys[i][1]))]
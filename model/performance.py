@@ -0,0 +1,207 @@
+import math
+import os
+import re
+import numpy as np
+
+# REMOTE-MEMORY PERFORMANCE MODEL
+#
+# Predicts memcached throughput and latency on Hydra remote memory from the
+# fault rate injected by the resilience manager, the expected extra reads a_r,
+# the latency of a remote page read and the fraction of memory that is local.
+#
+# A request takes service_us of CPU time plus, for each of pages_per_request
+# page accesses that miss local memory, one remote page read. A remote page
+# read fetches `fragments` fragments in parallel (remote_us), repeats a_r extra
+# fragment reads after it and waits fault_latency_us for every injected fault.
+# fault_injection_distr=F makes every fragment read fail with probability 1/F
+# (the resilience manager draws the gap between faults uniformly from
+# [1, 2F]); each failed data fragment costs one extra parity read unless a_r
+# is given explicitly, e.g. from ramp's scheme a_r.
+#
+# memcached's worker threads form an M/M/c queue, whose Erlang C waiting
+# probability gives the mean latency and, through the exponential waiting
+# time tail, the latency quantiles.
+
+class remote_memory_performance:
+    def __init__(self, service_us=10., remote_us=6., fault_latency_us=30., local_fraction=0.5,
+                 pages_per_request=1., fragments=4, threads=4):
+        self.service_us = service_us
+        self.remote_us = remote_us
+        self.fault_latency_us = fault_latency_us
+        self.local_fraction = local_fraction
+        self.pages_per_request = pages_per_request
+        self.fragments = fragments
+        self.threads = threads
+
+    # expected injected faults per remote page read
+    def faults_per_page(self, fault_rate):
+        if not fault_rate:
+            return 0.
+        return self.fragments / fault_rate
+
+    def page_us(self, fault_rate=0, a_r=None):
+        faults = self.faults_per_page(fault_rate)
+        a_r = faults if a_r is None else a_r
+        return self.remote_us * (1 + a_r) + faults * self.fault_latency_us
+
+    def request_us(self, fault_rate=0, a_r=None):
+        misses = self.pages_per_request * (1 - self.local_fraction)
+        return self.service_us + misses * self.page_us(fault_rate, a_r)
+
+    # throughput, capacity, utilization and mean and quantile latency in
+    # microseconds for an offered load of qps requests per second
+    def predict(self, qps, fault_rate=0, a_r=None, quantile=0.99):
+        s = self.request_us(fault_rate, a_r) * 1e-6
+        c = self.threads
+        capacity = c / s
+        throughput = min(qps, capacity)
+        rho = min(qps / capacity, 1.)
+        if rho >= 1.:
+            return {'throughput': capacity, 'capacity': capacity, 'utilization': 1., 'latency_avg': math.inf, 'latency_tail': math.inf}
+        p_wait = erlang_c(c, qps * s)
+        rate = c / s - qps
+        wait_avg = p_wait / rate
+        return {
+            'throughput': throughput,
+            'capacity': capacity,
+            'utilization': rho,
+            'latency_avg': (s + wait_avg) * 1e6,
+            'latency_tail': _response_quantile(1 / s, rate, p_wait, quantile) * 1e6,
+        }
+
+# quantile of the M/M/c response time: exponential service at rate mu after a
+# wait that is zero with probability 1-p_wait and exponential at rate r
+# otherwise
+def _response_quantile(mu, r, p_wait, quantile):
+    def sf(x):
+        if abs(r - mu) < 1e-9 * mu:
+            both = (1 + mu*x) * math.exp(-mu*x)
+        else:
+            both = (r*math.exp(-mu*x) - mu*math.exp(-r*x)) / (r - mu)
+        return (1 - p_wait) * math.exp(-mu*x) + p_wait * both
+    lo, hi = 0., 1 / min(mu, r)
+    while sf(hi) > 1 - quantile:
+        hi *= 2
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if sf(mid) > 1 - quantile:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+# probability that an arrival waits in an M/M/c queue with offered load a
+def erlang_c(c, a):
+    # Erlang B by its stable recursion, then C from B
+    b = 1.
+    for i in range(1, c+1):
+        b = a * b / (i + a * b)
+    rho = a / c
+    return b / (1 - rho * (1 - b))
+
+# MEASUREMENTS
+#
+# run_multiple in test.py writes the output of memcache-perf to files named
+# qps=<qps>-fault_rate=<rate>-<iteration>. Latencies are in microseconds.
+
+_RESULT_NAME = re.compile(r"qps=(\d+)-fault_rate=(\d+)-(\d+)$")
+_TOTAL_QPS = re.compile(r"Total QPS = ([0-9.]+)")
+
+# read latency statistics and total QPS from memcache-perf output
+def parse_mcperf(text):
+    result = {}
+    header = None
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == '#type':
+            header = fields[1:]
+        elif header is not None and fields[0] == 'read' and len(fields) == len(header) + 1:
+            result.update({name: float(v) for name, v in zip(header, fields[1:])})
+        m = _TOTAL_QPS.search(line)
+        if m:
+            result['qps'] = float(m.group(1))
+    return result
+
+def load_results(results_dir):
+    results = []
+    for name in sorted(os.listdir(results_dir)):
+        m = _RESULT_NAME.match(name)
+        if not m:
+            continue
+        with open(os.path.join(results_dir, name)) as fo:
+            measured = parse_mcperf(fo.read())
+        if 'qps' not in measured:
+            continue
+        results.append({'offered_qps': int(m.group(1)), 'fault_rate': int(m.group(2)), 'iteration': int(m.group(3)), **measured})
+    return results
+
+# CALIBRATION
+#
+# fit adjusts the named parameters of a model so that its predictions match
+# measured throughput, mean latency and tail latency in the least squares
+# sense on a log scale. Parameters are searched in log space, which keeps
+# them positive, with a Nelder-Mead simplex.
+#
+# At saturation the latency grows with the length of the run rather than
+# with the parameters, so points that the model predicts to be saturated, or
+# whose measured throughput falls below SATURATED times the offered load,
+# are scored on throughput alone; a measured saturated point compares the
+# predicted capacity with the measured QPS.
+
+SATURATED = 0.95
+
+def fit(results, model=None, params=('service_us', 'remote_us'), quantile=0.99, tail='99th', iterations=2000):
+    model = model if model is not None else remote_memory_performance()
+    x0 = np.log([getattr(model, p) for p in params])
+
+    def loss(x):
+        for p, v in zip(params, np.exp(x)):
+            setattr(model, p, float(v))
+        err = 0.
+        for r in results:
+            pred = model.predict(r['offered_qps'], r['fault_rate'], quantile=quantile)
+            if r['qps'] < SATURATED * r['offered_qps']:
+                err += math.log(pred['capacity'] / r['qps'])**2
+                continue
+            err += math.log(pred['throughput'] / r['qps'])**2
+            if pred['utilization'] >= 1.:
+                continue
+            if 'avg' in r:
+                err += math.log(pred['latency_avg'] / r['avg'])**2
+            if tail in r:
+                err += math.log(pred['latency_tail'] / r[tail])**2
+        return err
+
+    x = _nelder_mead(loss, x0, iterations)
+    loss(x)
+    return model
+
+def _nelder_mead(f, x0, iterations, step=0.5, tol=1e-10):
+    simplex = [x0] + [x0 + step * e for e in np.eye(len(x0))]
+    values = [f(x) for x in simplex]
+    for _ in range(iterations):
+        order = np.argsort(values)
+        simplex = [simplex[i] for i in order]
+        values = [values[i] for i in order]
+        if abs(values[-1] - values[0]) < tol:
+            break
+        centroid = np.mean(simplex[:-1], axis=0)
+        reflected = centroid + (centroid - simplex[-1])
+        fr = f(reflected)
+        if fr < values[0]:
+            expanded = centroid + 2 * (centroid - simplex[-1])
+            fe = f(expanded)
+            simplex[-1], values[-1] = (expanded, fe) if fe < fr else (reflected, fr)
+        elif fr < values[-2]:
+            simplex[-1], values[-1] = reflected, fr
+        else:
+            contracted = centroid + 0.5 * (simplex[-1] - centroid)
+            fc = f(contracted)
+            if fc < values[-1]:
+                simplex[-1], values[-1] = contracted, fc
+            else:
+                simplex = [simplex[0] + 0.5 * (x - simplex[0]) for x in simplex]
+                values = [f(x) for x in simplex]
+    return simplex[int(np.argmin(values))]
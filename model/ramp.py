@@ -0,0 +1,561 @@
+import functools
+import itertools
+import math
+import numpy as np
+from binomial import log_binom_pmf, log_binom_sf, log_comb, log_p_q, logsumexp
+import nde
+from cache import memoize
+from sweep import map_chunks
+
+# RAMP MODEL LIBRARY
+#
+# The analytical two-tier resilience model. Importing this module does no
+# work beyond defining functions, and it does not depend on matplotlib;
+# plots live in resilience_model.py.
+
+# default lower-tier data bits per codeword and raw bit error rate
+K = 256*8
+RBER = 2*10**-4
+
+def hamming_bound(t, n):
+    s = sum([math.comb(n,k) for k in range(1,t+1)])
+    r=1-math.log(s,2)/n
+    return r
+
+# RACK-SCALE REDUNDANCY MODEL
+
+# probability to fail when reading a block
+#
+# b block size
+# c cache line size
+# p_c probability to fail when reading a cache line
+def p_b(b, c, p_c):
+    if _is_scalar(b, c, p_c):
+        return math.exp(_log_p_b(b, c, p_c)[0])
+    return float(p_b_vec(b, c, p_c))
+
+# SCALAR RACK-SCALE REDUNDANCY MODEL
+#
+# p_b, p_due and a_r of a single configuration in plain floats, with the same
+# log-space formulas as the array kernels below. Their numpy overhead of tens
+# of microseconds per call would dominate loops that evaluate one
+# configuration at a time, such as the optimizer's.
+
+def _is_scalar(b, c, p_c):
+    return all(isinstance(x, (int, float)) for x in (b, c, p_c))
+
+def _log_p_b(b, c, p_c):
+    if p_c >= 1:
+        return 0., -math.inf
+    log_q = math.ceil(b / c) * math.log1p(-p_c)
+    return (math.log(-math.expm1(log_q)) if log_q < 0 else -math.inf), log_q
+
+# log of C(n, i) p^i q^(n-i), with 0*log(0) taken as 0
+def _log_binom_term(i, n, log_p, log_q):
+    log_term = math.lgamma(n+1) - math.lgamma(i+1) - math.lgamma(n-i+1)
+    if i > 0:
+        log_term += i * log_p
+    if n > i:
+        log_term += (n-i) * log_q
+    return log_term
+
+def _logsumexp(terms):
+    top = max(terms, default=-math.inf)
+    if top == -math.inf:
+        return -math.inf
+    return top + math.log(sum(math.exp(x - top) for x in terms))
+
+# log of P[X >= j] for X ~ Binomial(n, p), for the few fragments of a scheme
+def _log_binom_sf(j, n, log_p, log_q):
+    return _logsumexp([_log_binom_term(i, n, log_p, log_q) for i in range(max(j, 0), n+1)])
+
+# _a_r_vec for one configuration
+def _a_r(k, m, log_p, log_q):
+    log_s1 = _logsumexp([math.lgamma(k+i) - math.lgamma(i+1) - math.lgamma(k) + i*log_p + k*log_q + math.log(i)
+                         for i in range(1, m+1)] if log_p > -math.inf else [])
+    log_k_tail = math.log(k) + _log_binom_sf(m+1, k+m, log_p, log_q)
+    if log_s1 == -math.inf:
+        return -math.exp(log_k_tail)
+    # S1 is negligible next to k P[tail] when it is far below it
+    if log_k_tail - log_s1 > 700:
+        return math.exp(log_s1) - math.exp(log_k_tail)
+    return math.exp(log_s1) * -math.expm1(log_k_tail - log_s1)
+
+# VECTORIZED RACK-SCALE REDUNDANCY MODEL
+#
+# Array-in/array-out counterparts of p_b and of the replication schemes below.
+# p_c and b may be scalars or arrays and broadcast against each other.
+# Probabilities are carried as natural logarithms so that the products of many
+# small terms neither underflow nor lose the precision the Decimal code keeps.
+
+# log of the probability to fail when reading a block and log of its complement
+#
+# p_c may also be a model of correlated faults such as faults.dram_faults,
+# which computes the block failure probability itself.
+def log_p_b_vec(b, c, p_c):
+    if hasattr(p_c, 'log_p_b'):
+        return p_c.log_p_b(b, c)
+    p_c = np.asarray(p_c, dtype=float)
+    lines = np.ceil(np.asarray(b, dtype=float) / c)
+    with np.errstate(divide='ignore'):
+        log_q = lines * np.log1p(-p_c)
+        log_p = np.log(-np.expm1(log_q))
+    return log_p, log_q
+
+def p_b_vec(b, c, p_c):
+    return np.exp(log_p_b_vec(b, c, p_c)[0])
+
+# expected number of extra reads when a read needs k good fragments and gives
+# up after m additional fragments, each fragment failing with probability p
+#
+# The negative binomial sum -k + sum_i C(k+i-1,i) p^i q^k (k+i) is rewritten as
+# S1 - k P[more than m failures] so that the leading -k cancels analytically.
+def _a_r_vec(k, m, log_p, log_q):
+    ii = np.arange(0, m+1).reshape((-1,) + (1,)*np.ndim(log_p))
+    log_w = log_comb(k+ii-1, ii)
+    with np.errstate(invalid='ignore'):
+        log_w = log_w + np.where(ii > 0, ii*log_p, 0.) + k*log_q
+    with np.errstate(divide='ignore'):
+        log_s1 = logsumexp(log_w[1:] + np.log(ii[1:]), axis=0) if m > 0 else np.full(np.shape(log_p), -np.inf)
+    # P[fewer than k good fragments among k+m] = P[Bin(k+m, p) >= m+1]
+    log_tail = log_binom_sf(m+1, k+m, log_p, log_q)
+    log_k_tail = math.log(k) + log_tail
+    with np.errstate(invalid='ignore', over='ignore'):
+        a_r = np.exp(log_s1) * -np.expm1(log_k_tail - log_s1)
+    return np.where(np.isfinite(log_s1), a_r, -np.exp(log_k_tail))
+
+class erasure_coding:
+    def __init__(self, n_replicas, k_replicas):
+        self.n_replicas = n_replicas
+        self.k_replicas = k_replicas
+        self.m_replicas = n_replicas - k_replicas
+
+    def p_due(self, b, c, p_c):
+        if _is_scalar(b, c, p_c):
+            return math.exp(_log_binom_sf(self.m_replicas+1, self.n_replicas, *_log_p_b(b, c, p_c)))
+        return float(self.p_due_vec(b, c, p_c))
+
+    def a_r(self, b, c, p_c):
+        if _is_scalar(b, c, p_c):
+            return _a_r(self.k_replicas, self.m_replicas, *_log_p_b(b / self.k_replicas, c, p_c))
+        return float(self.a_r_vec(b, c, p_c))
+
+    def log_p_due_vec(self, b, c, p_c):
+        n = self.n_replicas
+        k = self.k_replicas
+        log_pb, log_qb = log_p_b_vec(b, c, p_c)
+        return log_binom_sf(n-k+1, n, log_pb, log_qb)
+
+    def p_due_vec(self, b, c, p_c):
+        return np.exp(self.log_p_due_vec(b, c, p_c))
+
+    def a_r_vec(self, b, c, p_c):
+        n = self.n_replicas
+        k = self.k_replicas
+        fragment_size = np.asarray(b, dtype=float) / self.k_replicas
+        log_pr, log_qr = log_p_b_vec(fragment_size, c, p_c)
+        return _a_r_vec(k, n-k, log_pr, log_qr)
+
+    # a read returns corrupted data when one of the k fragments it decodes
+    # from holds a silently corrupted cache line
+    def p_sdc(self, b, c, p_sdc_line):
+        return float(self.p_sdc_vec(b, c, p_sdc_line))
+
+    def log_p_sdc_vec(self, b, c, p_sdc_line):
+        fragment_size = np.asarray(b, dtype=float) / self.k_replicas
+        log_q = self.k_replicas * log_p_b_vec(fragment_size, c, p_sdc_line)[1]
+        with np.errstate(divide='ignore'):
+            return np.log(-np.expm1(log_q))
+
+    def p_sdc_vec(self, b, c, p_sdc_line):
+        return np.exp(self.log_p_sdc_vec(b, c, p_sdc_line))
+
+class complete_replication:
+    def __init__(self, n_replicas):
+        self.n_replicas = n_replicas
+
+    def p_due(self, b, c, p_c):
+        if _is_scalar(b, c, p_c):
+            return math.exp(self.n_replicas * _log_p_b(b, c, p_c)[0])
+        return float(self.p_due_vec(b, c, p_c))
+
+    def a_r(self, b, c, p_c):
+        if _is_scalar(b, c, p_c):
+            return _a_r(1, self.n_replicas-1, *_log_p_b(b, c, p_c))
+        return float(self.a_r_vec(b, c, p_c))
+
+    def log_p_due_vec(self, b, c, p_c):
+        return self.n_replicas * log_p_b_vec(b, c, p_c)[0]
+
+    def p_due_vec(self, b, c, p_c):
+        return np.exp(self.log_p_due_vec(b, c, p_c))
+
+    def a_r_vec(self, b, c, p_c):
+        log_pb, log_qb = log_p_b_vec(b, c, p_c)
+        return _a_r_vec(1, self.n_replicas-1, log_pb, log_qb)
+
+    # a read returns corrupted data when the replica it reads holds a
+    # silently corrupted cache line
+    def p_sdc(self, b, c, p_sdc_line):
+        return float(self.p_sdc_vec(b, c, p_sdc_line))
+
+    def log_p_sdc_vec(self, b, c, p_sdc_line):
+        return log_p_b_vec(b, c, p_sdc_line)[0]
+
+    def p_sdc_vec(self, b, c, p_sdc_line):
+        return np.exp(self.log_p_sdc_vec(b, c, p_sdc_line))
+
+# CHIPKILL MODEL
+
+# probability that a codeword that can correct t bad bits will fail
+#
+# t maximum number of bad bits
+# n codeword length
+#
+# approximate: usually RBER is small. Then (1-RBER) is about 1 and the first
+# term in the sum is dominates, so PCW is proportional to RBER^(E+1)
+def p_cw(n, t, rber, approximate=True):
+    if approximate:
+        return p_cw_approximate(n, t, rber)
+    else:
+        return p_cw_precise(n, t, rber)
+
+def p_cw_approximate(n, t, rber):
+    return np.exp(log_binom_pmf(t+1, n, *log_p_q(rber)))
+
+def p_cw_precise(n, t, rber):
+    return np.exp(log_binom_sf(t+1, n, *log_p_q(rber)))
+
+# Uncorrectable bit error rate
+def uber(n, t, rber):
+    return p_cw(n, t, rber)/n
+
+# Probability the BCH(n,k,t) codeword will fail
+def p_bch(n, k, t, rber, approximate=True):
+    return p_cw(n, t, rber, approximate=approximate)
+
+# Length of BCH codeword to correct t bad bits in k bits of data
+def bch_n(k, t):
+    return k + int(t * (math.log(k, 2) + 1))
+
+# Maximum number of bad bits we can correct with BCH(n,k)
+def bch_t(n, k):
+    r = n-k
+    return int(r / (math.log(k, 2) + 1))
+
+def p_nde_chipkill(n,t,p):
+    return nde.p_nde_bch_lookup(n, t, p)
+
+# probability that the chipkill scheme will fail due to bit errors
+P_RS = 0.018
+
+@memoize
+def p_chipkill(n, k, t, rber, approximate=True):
+    p_rs = P_RS
+    return p_rs * p_bch(n, k, t, rber, approximate=approximate)
+
+# log of p_chipkill for arrays of n, t and rber, which broadcast against each other
+def log_p_chipkill_vec(n, k, t, rber, approximate=True):
+    log_p, log_q = log_p_q(rber)
+    if approximate:
+        return math.log(P_RS) + log_binom_pmf(np.asarray(t)+1, n, log_p, log_q)
+    n, t, log_p, log_q = np.broadcast_arrays(n, t, log_p, log_q)
+    out = np.empty(n.shape)
+    for idx in np.ndindex(n.shape):
+        out[idx] = log_binom_sf(int(t[idx])+1, int(n[idx]), log_p[idx], log_q[idx])
+    return math.log(P_RS) + out
+
+# SILENT DATA CORRUPTION
+#
+# A Reed-Solomon codeword of k data and r check symbols of s bits that
+# corrects t symbols corrupts data silently when r+1-t symbols are wrong and
+# the received word falls into the decoding sphere of another codeword, which
+# happens with probability C(k+r, t) 2^(s t) / 2^(s r). Everything is
+# evaluated in log space, so symbols of any size and whole arrays of rber, k,
+# r and t, which broadcast against each other, are handled at once.
+#
+# approximate: only the first failing term, as sdc_chipkill always did;
+# otherwise the whole tail of r+1-t or more symbol errors.
+
+SDC_SYMBOL_BITS = 8
+SDC_CHECK_SYMBOLS = 8
+SDC_T = 2
+
+def log_sdc_vec(rber, symbol_bits=SDC_SYMBOL_BITS, k=64, r=SDC_CHECK_SYMBOLS, t=SDC_T, approximate=True):
+    log_p, log_q = log_p_q(rber)
+    # a symbol is wrong when any of its bits is
+    log_q_sym = symbol_bits * log_q
+    with np.errstate(divide='ignore'):
+        log_p_sym = np.log(-np.expm1(log_q_sym))
+    n = np.asarray(k) + np.asarray(r)
+    n_th = np.asarray(r) + 1 - np.asarray(t)
+    if approximate:
+        log_errors = log_binom_pmf(n_th, n, log_p_sym, log_q_sym)
+    else:
+        n, n_th, log_p_sym, log_q_sym = np.broadcast_arrays(n, n_th, log_p_sym, log_q_sym)
+        log_errors = np.empty(n.shape)
+        for idx in np.ndindex(n.shape):
+            log_errors[idx] = log_binom_sf(int(n_th[idx]), int(n[idx]), log_p_sym[idx], log_q_sym[idx])
+    log_miscorrect = log_comb(n, t) + (np.asarray(t) - np.asarray(r)) * symbol_bits * math.log(2)
+    return log_errors + log_miscorrect
+
+def sdc_vec(rber, symbol_bits=SDC_SYMBOL_BITS, k=64, r=SDC_CHECK_SYMBOLS, t=SDC_T, approximate=True):
+    return np.exp(log_sdc_vec(rber, symbol_bits, k, r, t, approximate))
+
+# SDC of the chipkill code protecting a 64 byte cache line
+def sdc_chipkill(rber):
+    return float(sdc_vec(rber, 8, 64, 8, 2))
+
+# SDC of the cache lines of c bytes, one chipkill codeword each
+def sdc_line_vec(rber, c):
+    return sdc_vec(rber, SDC_SYMBOL_BITS, np.asarray(c) * 8 // SDC_SYMBOL_BITS)
+
+def storage_overhead(n, k):
+    r = n-k
+    v = r/k + (1+r/k)/8
+    return v*100
+
+def storage_overhead_to_n(overhead_perc, k):
+    v = overhead_perc / 100
+    r = math.ceil((8* v * k-k)/(9))
+    return int(r)+k
+
+# whether raising t beyond t can still lower p_chipkill, given its logs at t
+# and t+1. When the codeword gains fewer than 1/rber bits per unit of t, t
+# outgrows the mean number of bit errors and p_chipkill eventually falls
+# towards 0, whatever it does below the mean. Otherwise the tail tends to 1,
+# and raising t helps only while p_chipkill still falls.
+def _improving(log_p_c, log_p_c_next, k, rber):
+    return (np.asarray(rber) * (math.log(k, 2) + 1) < 1) | (log_p_c_next < log_p_c)
+
+# the storage overhead of the minimal t that meets uber, or None; a single
+# query evaluates SCAN_T values of t at once rather than bracketing the answer,
+# and stops at the first block past which raising t no longer helps
+SCAN_T = 64
+
+@memoize
+def storage_overhead_for_target_uber(k, rber, replication_scheme, b, c, uber):
+    if not uber > 0:
+        return None
+    for start in itertools.count(0, SCAN_T):
+        tt = np.arange(start, start + SCAN_T + 1)
+        nn = k + (tt * (math.log(k, 2) + 1)).astype(int)
+        log_p_c = log_p_chipkill_vec(nn, k, tt, rber)
+        with np.errstate(divide='ignore'):
+            met = replication_scheme.log_p_due_vec(b, c, np.exp(log_p_c[:-1])) < math.log(uber)
+        if met.any():
+            return storage_overhead(int(nn[np.argmax(met)]), k)
+        if not _improving(log_p_c[:-1], log_p_c[1:], k, rber).all():
+            return None
+
+# BATCH INVERSE SOLVER
+#
+# Finds, for each query (rber, replication_scheme, b, c, target), the minimal
+# BCH strength t whose DUE stays below target, and returns (t, n, storage
+# overhead) per query, or (None, None, None) when no t meets the target.
+#
+# p_due is increasing in p_c, and the scan of t stops where raising t no
+# longer helps (_improving), past which p_chipkill only grows. Where it still
+# helps, p_chipkill falls once t is past the mean number of bit errors, so the
+# predicate p_due(t) < target is taken to be false up to some t and true from
+# there on. All queries advance together: galloping doubles t until the
+# predicate holds or raising t stops helping, in which case bisection on the
+# slope finds the last t that helped; then bisection on the predicate closes
+# the bracket. Every round evaluates p_chipkill once per distinct (rber, t)
+# and p_due once per scheme. max_t optionally bounds the search.
+def solve_min_t(k, queries, approximate=True, max_t=None):
+    queries = list(queries)
+    rber = np.array([q[0] for q in queries], dtype=float)
+    log_p_c = {}
+
+    def log_p_c_at(tt):
+        missing = sorted({(queries[i][0], int(t)) for i, t in enumerate(tt)} - log_p_c.keys())
+        if missing:
+            rr = np.array([r for r, t in missing])
+            ts = np.array([t for r, t in missing])
+            nn = k + (ts * (math.log(k, 2) + 1)).astype(int)
+            log_p_c.update(zip(missing, log_p_chipkill_vec(nn, k, ts, rr, approximate=approximate)))
+        return np.array([log_p_c[(queries[i][0], int(t))] for i, t in enumerate(tt)])
+
+    def evaluate(tt):
+        tt = np.asarray(tt, dtype=int)
+        p_c_all = np.exp(log_p_c_at(tt))
+        met = np.empty(len(queries), dtype=bool)
+        groups = {}
+        for i, (rber_i, scheme, b, c, target) in enumerate(queries):
+            groups.setdefault((type(scheme), tuple(sorted(vars(scheme).items()))), []).append(i)
+        for ii in groups.values():
+            scheme = queries[ii[0]][1]
+            b = np.array([queries[i][2] for i in ii], dtype=float)
+            c = np.array([queries[i][3] for i in ii], dtype=float)
+            target = np.array([queries[i][4] for i in ii], dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                met[ii] = scheme.log_p_due_vec(b, c, p_c_all[ii]) < np.log(target)
+        return met
+
+    def improving(tt):
+        tt = np.asarray(tt, dtype=int)
+        return _improving(log_p_c_at(tt), log_p_c_at(tt + 1), k, rber)
+
+    # a target of 0 is never met, however far p_chipkill falls
+    meetable = np.array([q[4] > 0 for q in queries], dtype=bool)
+    bound = np.inf if max_t is None else max_t
+    lo = np.full(len(queries), -1)
+    hi = np.zeros(len(queries), dtype=int)
+    met = evaluate(hi)
+    down = improving(hi) & meetable
+    while True:
+        gallop = ~met & down & (hi < bound)
+        if not gallop.any():
+            break
+        lo = np.where(gallop, hi, lo)
+        hi = np.where(gallop, np.minimum(2*hi + 1, bound), hi).astype(int)
+        met = evaluate(hi)
+        down = improving(hi) & meetable
+
+    # p_chipkill has its minimum in (lo, hi] where raising t stopped helping,
+    # and the target is met only if it is met there
+    turned = ~met & ~down & meetable
+    left = lo.copy()
+    while np.any(turned & (hi - left > 1)):
+        narrowing = turned & (hi - left > 1)
+        mid = np.where(narrowing, (left + hi) // 2, hi)
+        d = improving(mid)
+        left = np.where(narrowing & d, mid, left)
+        hi = np.where(narrowing & ~d, mid, hi)
+    met = np.where(turned, evaluate(hi), met)
+
+    solved = met
+    while np.any(solved & (hi - lo > 1)):
+        mid = np.where(solved & (hi - lo > 1), (lo + hi) // 2, hi)
+        met = evaluate(mid)
+        hi = np.where(met, mid, hi)
+        lo = np.where(met, lo, mid)
+
+    results = []
+    for t, ok in zip(hi, solved):
+        if not ok:
+            results.append((None, None, None))
+            continue
+        n = bch_n(k, int(t))
+        results.append((int(t), n, storage_overhead(n, k)))
+    return results
+
+# solve_min_t on a process pool, for batches of at least PARALLEL_MIN_QUERIES
+# queries; smaller ones take less time than starting the pool. Queries are
+# chunked in the order of their rber, so that the queries of a chunk share
+# their p_chipkill evaluations.
+PARALLEL_MIN_QUERIES = 8192
+
+def solve_min_t_parallel(k, queries, approximate=True, max_t=None):
+    queries = list(queries)
+    if len(queries) < PARALLEL_MIN_QUERIES:
+        return solve_min_t(k, queries, approximate=approximate, max_t=max_t)
+    order = sorted(range(len(queries)), key=lambda i: queries[i][0])
+    solved = map_chunks(functools.partial(solve_min_t, k, approximate=approximate, max_t=max_t), [queries[i] for i in order])
+    results = [None] * len(queries)
+    for i, result in zip(order, solved):
+        results[i] = result
+    return results
+
+# CONFIGURATION EVALUATION
+
+# the scheme described by spec: "none", "rep:<replicas>" or "ec:<n>:<k>"
+def parse_scheme(spec):
+    fields = spec.split(':')
+    if fields[0] == 'none' and len(fields) == 1:
+        return complete_replication(1)
+    if fields[0] == 'rep' and len(fields) == 2:
+        return complete_replication(int(fields[1]))
+    if fields[0] == 'ec' and len(fields) == 3:
+        return erasure_coding(int(fields[1]), int(fields[2]))
+    raise ValueError(f"invalid scheme '{spec}', expected none, rep:<replicas> or ec:<n>:<k>")
+
+def scheme_name(replication_scheme):
+    if isinstance(replication_scheme, erasure_coding):
+        return f"ec:{replication_scheme.n_replicas}:{replication_scheme.k_replicas}"
+    if replication_scheme.n_replicas == 1:
+        return "none"
+    return f"rep:{replication_scheme.n_replicas}"
+
+# all model outputs for one two-tier configuration
+def evaluate_configuration(k, t, rber, replication_scheme, b, c, approximate=True):
+    n = bch_n(k, t)
+    p_c = p_chipkill(n, k, t, rber, approximate=approximate)
+    return {
+        'scheme': scheme_name(replication_scheme),
+        'n': n,
+        'k': k,
+        't': t,
+        'rber': rber,
+        'b': b,
+        'c': c,
+        'storage_overhead': storage_overhead(n, k),
+        'p_c': float(p_c),
+        'p_due': replication_scheme.p_due(b, c, p_c),
+        'p_nde': p_nde_chipkill(n, t, rber),
+        'a_r': replication_scheme.a_r(b, c, p_c),
+        'p_sdc': replication_scheme.p_sdc(b, c, sdc_line_vec(rber, c)),
+    }
+
+# STREAMING SWEEPS
+#
+# sweep walks the cartesian product of its arguments lazily and yields the
+# results as structured arrays of RECORD_DTYPE, chunksize rows at a time, so
+# that grids of any size can be written out without holding them in memory.
+
+RECORD_DTYPE = np.dtype([
+    ('scheme', 'U16'),
+    ('n', np.int64),
+    ('k', np.int64),
+    ('t', np.int64),
+    ('rber', np.float64),
+    ('b', np.int64),
+    ('c', np.int64),
+    ('storage_overhead', np.float64),
+    ('p_c', np.float64),
+    ('p_due', np.float64),
+    ('p_nde', np.float64),
+    ('a_r', np.float64),
+    ('p_sdc', np.float64),
+])
+
+# faults, when given, turns an array of p_c into a model of correlated
+# faults (see faults.py) that p_due and a_r use instead of p_c
+def _evaluate_chunk(k, rows, approximate, faults=None):
+    out = np.empty(len(rows), dtype=RECORD_DTYPE)
+    t = np.array([row[0] for row in rows], dtype=np.int64)
+    rber = np.array([row[1] for row in rows], dtype=np.float64)
+    b = np.array([row[3] for row in rows], dtype=np.int64)
+    c = np.array([row[4] for row in rows], dtype=np.int64)
+    n = k + (t * (math.log(k, 2) + 1)).astype(np.int64)
+    p_c = np.exp(log_p_chipkill_vec(n, k, t, rber, approximate=approximate))
+    out['n'] = n
+    out['k'] = k
+    out['t'] = t
+    out['rber'] = rber
+    out['b'] = b
+    out['c'] = c
+    out['storage_overhead'] = storage_overhead(n, k)
+    out['p_c'] = p_c
+    p_nde = {key: p_nde_chipkill(*key) for key in set(zip(n.tolist(), t.tolist(), rber.tolist()))}
+    out['p_nde'] = [p_nde[key] for key in zip(n.tolist(), t.tolist(), rber.tolist())]
+    p_sdc_line = sdc_line_vec(rber, c)
+    names = np.array([scheme_name(row[2]) for row in rows])
+    out['scheme'] = names
+    for name in np.unique(names):
+        mask = names == name
+        replication_scheme = parse_scheme(name)
+        p_fail = p_c[mask] if faults is None else faults(p_c[mask])
+        out['p_due'][mask] = replication_scheme.p_due_vec(b[mask], c[mask], p_fail)
+        out['a_r'][mask] = replication_scheme.a_r_vec(b[mask], c[mask], p_fail)
+        out['p_sdc'][mask] = replication_scheme.p_sdc_vec(b[mask], c[mask], p_sdc_line[mask])
+    return out
+
+def sweep(k, tt, rbers, schemes, bb, cc, approximate=True, chunksize=65536, faults=None):
+    grid = itertools.product(tt, rbers, schemes, bb, cc)
+    while True:
+        rows = list(itertools.islice(grid, chunksize))
+        if not rows:
+            return
+        yield _evaluate_chunk(k, rows, approximate, faults)
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import itertools
+import os
+import sys
+
+import cache
+import export
+import faults as dram
+import montecarlo
+import optimize as optimizer
+import uncertainty
+from ramp import K, RBER, RECORD_DTYPE, parse_scheme, scheme_name, solve_min_t_parallel, sweep
+
+# HEADLESS COMMAND LINE INTERFACE
+#
+# Evaluates model configurations and sweeps from arguments and writes the
+# numbers as CSV, without importing matplotlib. Every list-valued argument
+# spans one axis of the grid; the rows are its cartesian product.
+#
+#   python3 ramp_cli.py evaluate --t 0:24 --scheme none rep:3 ec:6:4
+#   python3 ramp_cli.py evaluate --t 0:64 --b 64:16384:64 --columnar sweep
+#   python3 ramp_cli.py solve --rber 1e-3 1e-4 --b 64 4096 --target 1e-32
+#   python3 ramp_cli.py optimize --k 1024 2048 4096 --scheme none rep:2 rep:3 ec:6:4 ec:10:8
+#   python3 ramp_cli.py simulate --t 1 10 --scheme rep:3 --importance
+#   python3 ramp_cli.py uncertainty --t 0:24 --rber-dist lognormal:2e-4:0.5 --scheme rep:3 ec:6:4
+#   python3 ramp_cli.py uncertainty --t 0:24 --scheme none rep:3 ec:6:4 --plot due_band_vs_t.pdf
+#   python3 ramp_cli.py plot
+
+def _int_range(s):
+    fields = [int(f) for f in s.split(':')]
+    if len(fields) == 1:
+        return range(fields[0], fields[0]+1)
+    return range(*fields)
+
+def _flatten(ranges):
+    return [v for r in ranges for v in r]
+
+def _writer(path):
+    fo = open(path, 'w', newline='') if path else sys.stdout
+    return fo, csv.writer(fo)
+
+def evaluate(args):
+    schemes = [parse_scheme(s) for s in args.scheme]
+    faults = None
+    if args.fault_hours is not None:
+        faults = lambda p_c: dram.dram_faults(p_c, dram.FIELD_MODES, hours=args.fault_hours)
+    chunks = sweep(args.k, _flatten(args.t), args.rber, schemes, _flatten(args.b), args.c, approximate=not args.precise, faults=faults)
+    if args.columnar:
+        metadata = {'k': args.k, 't': [list(r) for r in args.t], 'rber': args.rber,
+            'scheme': [scheme_name(s) for s in schemes], 'b': [list(r) for r in args.b], 'c': args.c,
+            'approximate': not args.precise}
+        export.write_columns(args.columnar, chunks, RECORD_DTYPE, metadata)
+        return
+    fo, writer = _writer(args.output)
+    writer.writerow(RECORD_DTYPE.names)
+    for chunk in chunks:
+        writer.writerows(chunk.tolist())
+    if fo is not sys.stdout:
+        fo.close()
+
+def solve(args):
+    grid = list(itertools.product(args.rber, args.scheme, _flatten(args.b), args.c, args.target))
+    results = solve_min_t_parallel(args.k, [(rber, parse_scheme(s), b, c, target) for rber, s, b, c, target in grid], approximate=not args.precise)
+    fo, writer = _writer(args.output)
+    writer.writerow(['scheme', 'rber', 'b', 'c', 'target', 'n', 'k', 't', 'storage_overhead'])
+    for (rber, s, b, c, target), (t, n, v) in zip(grid, results):
+        writer.writerow([scheme_name(parse_scheme(s)), rber, b, c, target, n, args.k, t, v])
+    if fo is not sys.stdout:
+        fo.close()
+
+OPTIMIZE_FIELDS = ['scheme', 'rber', 'b', 'c', 'n', 'k', 't', 'storage_overhead', 'total_storage_overhead', 'p_c', 'p_due', 'p_nde', 'a_r']
+
+def optimize(args):
+    frontier = optimizer.optimize(args.rber[0], args.k, [parse_scheme(s) for s in args.scheme], _flatten(args.b), args.c,
+        uber=args.target, nde=args.nde, a_r_max=args.a_r_max, t_max=args.t_max, upper_tier=not args.lower_tier_only,
+        approximate=not args.precise)
+    fo, writer = _writer(args.output)
+    writer.writerow(OPTIMIZE_FIELDS)
+    for point in frontier:
+        writer.writerow([point[f] for f in OPTIMIZE_FIELDS])
+    if fo is not sys.stdout:
+        fo.close()
+
+def simulate(args):
+    fo, writer = _writer(args.output)
+    writer.writerow(['scheme', 'rber', 'b', 'c', 'n', 'k', 't', 'quantity', 'estimate', 'ci_low', 'ci_high', 'analytic', 'samples'])
+    for t, rber, s, b, c in itertools.product(_flatten(args.t), args.rber, args.scheme, _flatten(args.b), args.c):
+        scheme = parse_scheme(s)
+        if args.importance:
+            results = montecarlo.simulate_importance(args.k, t, rber, scheme, b, c, blocks=args.blocks, seed=args.seed)
+        else:
+            results = montecarlo.simulate(args.k, t, rber, scheme, b, c, blocks=args.blocks, seed=args.seed)
+        for quantity in ('p_due', 'a_r'):
+            if quantity in results:
+                r = results[quantity]
+                writer.writerow([scheme_name(scheme), rber, b, c, montecarlo.bch_n(args.k, t), args.k, t, quantity,
+                    r['estimate'], r['ci_low'], r['ci_high'], r['analytic'], r['samples']])
+    if fo is not sys.stdout:
+        fo.close()
+
+def propagate(args):
+    inputs = {'rber': args.rber_dist, 'p_rs': args.p_rs}
+    if args.p_c:
+        inputs = {'p_c': args.p_c}
+    schemes = [parse_scheme(s) for s in args.scheme]
+    result = uncertainty.propagate(inputs, schemes, _flatten(args.t), k=args.k, b=args.b, c=args.c,
+        samples=args.samples, replicates=args.replicates, quantiles=args.quantiles, seed=args.seed,
+        approximate=not args.precise)
+    fo, writer = _writer(args.output)
+    writer.writerow(['scheme', 'quantity', 't', 'b', 'c', 'mean', 'stderr'] + [f"q{q:g}" for q in args.quantiles])
+    rows = [('', 'p_c', result['p_c'])]
+    rows += [(scheme_name(s), quantity, result[scheme_name(s)][quantity]) for s in schemes for quantity in ('p_due', 'a_r')]
+    for name, quantity, stats in rows:
+        for i, t in enumerate(result['t']):
+            writer.writerow([name, quantity, int(t), args.b, args.c, stats['mean'][i], stats['stderr'][i]] + stats['quantiles'][:, i].tolist())
+    if fo is not sys.stdout:
+        fo.close()
+    if args.plot:
+        import resilience_model
+        resilience_model.save_figure(args.plot, resilience_model.plot_due_band_vs_t, result, [scheme_name(s) for s in schemes])
+
+def plot(args):
+    import resilience_model
+    resilience_model.plot_overhead_multifigure(args.k, args.rber[0])
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--k", type=int, default=K, help="data bits per lower-tier codeword")
+    common.add_argument("--rber", type=float, nargs='+', default=[RBER], help="raw bit error rates")
+    common.add_argument("--precise", action="store_true", help="sum the full codeword failure tail")
+    common.add_argument("--output", help="CSV file to write instead of stdout")
+
+    parser = argparse.ArgumentParser(description="Evaluate the RAMP two-tier resilience model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("evaluate", parents=[common], help="evaluate configurations")
+    p.add_argument("--t", type=_int_range, nargs='+', required=True, help="correctable bits, T or START:STOP[:STEP]")
+    p.add_argument("--scheme", nargs='+', default=["none"], help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=_int_range, nargs='+', default=[range(4096, 4097)], help="block sizes in bytes")
+    p.add_argument("--c", type=int, nargs='+', default=[64], help="cache line sizes in bytes")
+    p.add_argument("--columnar", metavar="DIR", help="write memory-mappable columns to DIR instead of CSV")
+    p.add_argument("--fault-hours", type=float, help="add row, column, bank and rank faults at field rates that persist this long")
+    p.set_defaults(func=evaluate)
+
+    p = subparsers.add_parser("solve", parents=[common], help="minimal lower-tier strength for a target UBER")
+    p.add_argument("--scheme", nargs='+', default=["none"], help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=_int_range, nargs='+', default=[range(4096, 4097)], help="block sizes in bytes")
+    p.add_argument("--c", type=int, nargs='+', default=[64], help="cache line sizes in bytes")
+    p.add_argument("--target", type=float, nargs='+', default=[1E-32], help="target UBER")
+    p.set_defaults(func=solve)
+
+    p = subparsers.add_parser("optimize", help="Pareto frontier of storage overhead, a_r and block size")
+    p.add_argument("--k", type=int, nargs='+', default=[K], help="data bits per lower-tier codeword")
+    p.add_argument("--rber", type=float, default=[RBER], nargs=1, help="raw bit error rate")
+    p.add_argument("--precise", action="store_true", help="sum the full codeword failure tail")
+    p.add_argument("--output", help="CSV file to write instead of stdout")
+    p.add_argument("--scheme", nargs='+', default=["none", "rep:2", "rep:3", "ec:6:4", "ec:10:8"], help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=_int_range, nargs='+', default=[range(4096, 4097)], help="block sizes in bytes")
+    p.add_argument("--c", type=int, default=64, help="cache line size in bytes")
+    p.add_argument("--target", type=float, default=1E-32, help="target UBER")
+    p.add_argument("--nde", type=float, help="maximal probability of a non-detectable error")
+    p.add_argument("--a-r-max", type=float, help="maximal expected extra reads")
+    p.add_argument("--t-max", type=int, default=64, help="largest correctable bits to consider")
+    p.add_argument("--lower-tier-only", action="store_true", help="minimize the lower-tier storage overhead only")
+    p.set_defaults(func=optimize)
+
+    p = subparsers.add_parser("simulate", parents=[common], help="check the model against Monte Carlo simulation")
+    p.add_argument("--t", type=_int_range, nargs='+', required=True, help="correctable bits, T or START:STOP[:STEP]")
+    p.add_argument("--scheme", nargs='+', default=["none"], help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=_int_range, nargs='+', default=[range(4096, 4097)], help="block sizes in bytes")
+    p.add_argument("--c", type=int, nargs='+', default=[64], help="cache line sizes in bytes")
+    p.add_argument("--blocks", type=lambda s: int(float(s)), default=10**6, help="simulated blocks per configuration")
+    p.add_argument("--seed", type=int, help="random seed")
+    p.add_argument("--importance", action="store_true", help="estimate p_due by importance sampling")
+    p.set_defaults(func=simulate)
+
+    p = subparsers.add_parser("uncertainty", help="quantiles of the model over uncertain inputs")
+    p.add_argument("--k", type=int, default=K, help="data bits per lower-tier codeword")
+    p.add_argument("--precise", action="store_true", help="sum the full codeword failure tail")
+    p.add_argument("--output", help="CSV file to write instead of stdout")
+    p.add_argument("--t", type=_int_range, nargs='+', required=True, help="correctable bits, T or START:STOP[:STEP]")
+    p.add_argument("--rber-dist", type=uncertainty.parse_distribution, default=uncertainty.lognormal(RBER, 0.5),
+        help="raw bit error rate: V, uniform:LO:HI, loguniform:LO:HI or lognormal:MEDIAN:DECADES")
+    p.add_argument("--p-rs", type=uncertainty.parse_distribution, default=uncertainty.fixed(uncertainty.P_RS),
+        help="probability that the RS stage of chipkill fails, as a distribution")
+    p.add_argument("--p-c", type=uncertainty.parse_distribution, help="cache line failure probability, replacing the chipkill model")
+    p.add_argument("--scheme", nargs='+', default=["none"], help="none, rep:<replicas> or ec:<n>:<k>")
+    p.add_argument("--b", type=int, default=4096, help="block size in bytes")
+    p.add_argument("--c", type=int, default=64, help="cache line size in bytes")
+    p.add_argument("--samples", type=int, default=2**13, help="Sobol points per replicate, a power of two")
+    p.add_argument("--replicates", type=int, default=8, help="independently shifted replicates")
+    p.add_argument("--quantiles", type=float, nargs='+', default=list(uncertainty.QUANTILES), help="quantiles to report")
+    p.add_argument("--seed", type=int, help="random seed")
+    p.add_argument("--plot", metavar="FILE", help="also draw the DUE band between the outer quantiles to FILE")
+    p.set_defaults(func=propagate)
+
+    p = subparsers.add_parser("plot", parents=[common], help="render the figures of resilience_model.py")
+    p.set_defaults(func=plot)
+
+    args = parser.parse_args(argv)
+    cache.configure(enabled=os.environ.get("RAMP_CACHE") != "0")
+    try:
+        args.func(args)
+    except BrokenPipeError:
+        # the reader of the CSV went away, e.g. | head; point stdout at
+        # /dev/null so that flushing it at exit does not raise again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
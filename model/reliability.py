@@ -0,0 +1,184 @@
+import math
+import numpy as np
+
+from ramp import erasure_coding, log_p_b_vec
+
+# CONTINUOUS-TIME MARKOV RELIABILITY MODEL
+#
+# The scheme classes give the probability that one read fails. Over the
+# lifetime of the data, fragments are lost (a node or slab fails) and rebuilt
+# by the resource monitors, and cache lines turn uncorrectable between scrubs.
+# The state of a coding group is (f, l): f fragments lost and l fragments
+# with a latent uncorrectable error. Per fragment, in events per hour:
+#
+#   (f, l) -> (f+1, l)    a healthy fragment is lost            failure_rate
+#   (f, l) -> (f+1, l-1)  a fragment with a latent error is lost failure_rate
+#   (f, l) -> (f, l+1)    a healthy fragment gets a latent error latent_rate
+#   (f, l) -> (f-1, l)    a lost fragment is rebuilt            repair_rate
+#   (f, l) -> (f, l-1)    a scrub fixes a latent error          scrub_rate
+#
+# Repairs run in parallel for all lost fragments unless parallel_repair is
+# false. Data is lost once f+l exceeds the n-k fragments the scheme
+# tolerates, since a read or rebuild then finds fewer than k good fragments.
+#
+# The generator is kept as sparse triplets. States are ordered by f and then
+# l, so the generator is banded with a bandwidth of about n-k, and the mean
+# time to data loss is one banded solve. Loss probabilities within a time
+# window come from uniformization with sparse products. Uniformization takes
+# about (largest outflow rate) x hours steps, which for repairs within hours
+# and windows of years is 10^4 to 10^6; chains of up to 512 states instead
+# square a dense matrix, which is at most 2 MB and needs only about log2 of
+# that many products.
+
+class markov_reliability:
+    def __init__(self, replication_scheme, failure_rate, repair_rate, latent_rate=0., scrub_rate=0., parallel_repair=True):
+        self.n = replication_scheme.n_replicas
+        self.k = replication_scheme.k_replicas if isinstance(replication_scheme, erasure_coding) else 1
+        self.m = self.n - self.k
+        self.failure_rate = failure_rate
+        self.repair_rate = repair_rate
+        self.latent_rate = latent_rate
+        self.scrub_rate = scrub_rate
+        self.parallel_repair = parallel_repair
+        # latent errors only matter while they can appear
+        lmax = self.m if latent_rate > 0 else 0
+        self.states = [(f, l) for f in range(0, self.m+1) for l in range(0, min(lmax, self.m-f)+1)]
+        self.index = {s: i for i, s in enumerate(self.states)}
+
+    # (rows, cols, rates) of the transitions between transient states and the
+    # rate of data loss out of every state
+    def generator(self):
+        rows, cols, rates = [], [], []
+        loss = np.zeros(len(self.states))
+        for i, (f, l) in enumerate(self.states):
+            healthy = self.n - f - l
+            moves = [
+                ((f+1, l), healthy * self.failure_rate),
+                ((f+1, l-1), l * self.failure_rate),
+                ((f, l+1), healthy * self.latent_rate),
+                ((f-1, l), (f if self.parallel_repair else min(f, 1)) * self.repair_rate),
+                ((f, l-1), l * self.scrub_rate),
+            ]
+            for target, rate in moves:
+                if rate <= 0:
+                    continue
+                if target[0] + target[1] > self.m:
+                    loss[i] += rate
+                else:
+                    rows.append(i)
+                    cols.append(self.index[target])
+                    rates.append(rate)
+        return np.array(rows, dtype=int), np.array(cols, dtype=int), np.array(rates, dtype=float), loss
+
+    # mean time to data loss in hours, starting with all fragments healthy;
+    # with many independent groups the first loss comes groups times sooner
+    def mttdl(self, groups=1):
+        rows, cols, rates, loss = self.generator()
+        tau = _gth_solve(rows, cols, rates, loss, np.ones(len(self.states)))
+        return tau[self.index[(0, 0)]] / groups
+
+    # probability that some of the groups loses data within hours
+    def loss_probability(self, hours, groups=1, tol=1E-15):
+        rows, cols, rates, loss = self.generator()
+        start = self.index[(0, 0)]
+        if len(self.states) <= 512:
+            p = _dense_loss(rows, cols, rates, loss, start, hours)
+        else:
+            p = _sparse_loss(rows, cols, rates, loss, start, hours, tol)
+        p = min(p, 1.)
+        return -math.expm1(groups * math.log1p(-p)) if p < 1 else 1.
+
+# rate per hour at which a fragment of the scheme gets an uncorrectable cache
+# line, when every line does so with probability p_c within period hours
+def latent_rate(replication_scheme, b, c, p_c, period):
+    fragment_size = b / replication_scheme.k_replicas if isinstance(replication_scheme, erasure_coding) else b
+    log_p, log_q = log_p_b_vec(fragment_size, c, p_c)
+    return float(-log_q / period)
+
+# SOLVERS
+#
+# Losses are rare, so every step avoids subtracting nearly equal numbers:
+# MTTDL solves -Q x = rhs by Gaussian elimination in band storage where every
+# pivot is recomputed as the sum of the remaining outflow rates (the
+# Grassmann-Taksar-Heyman variant), and the loss probabilities only add
+# nonnegative terms of the uniformized chain.
+
+def _gth_solve(rows, cols, rates, loss, rhs):
+    size = len(rhs)
+    lower = int(max(0, np.max(rows - cols, initial=0)))
+    upper = int(max(0, np.max(cols - rows, initial=0)))
+    # a[i, lower + j - i] holds the rate from i to j; fill-in stays in the band
+    width = lower + upper + 1
+    a = np.zeros((size, width))
+    np.add.at(a, (rows, lower + cols - rows), rates)
+    loss = np.array(loss, dtype=float)
+    x = np.array(rhs, dtype=float)
+    pivots = np.empty(size)
+    for i in range(size):
+        a[i, lower] = 0.
+        # outflow to the states not eliminated yet and to loss
+        pivots[i] = a[i, lower+1:].sum() + loss[i]
+        for r in range(i + 1, min(size, i + lower + 1)):
+            into = a[r, lower + i - r]
+            if into == 0.:
+                continue
+            share = into / pivots[i]
+            a[r, lower + i - r] = 0.
+            # row i covers columns i+1 .. i+upper, which sit at lower+i-r+1 .. in row r
+            span = min(upper, size - 1 - i)
+            a[r, lower+i-r+1:lower+i-r+1+span] += share * a[i, lower+1:lower+1+span]
+            loss[r] += share * loss[i]
+            x[r] += share * x[i]
+    for i in range(size - 1, -1, -1):
+        span = min(upper, size - 1 - i)
+        x[i] = (x[i] + a[i, lower+1:lower+1+span] @ x[i+1:i+1+span]) / pivots[i]
+    return x
+
+# the uniformized chain with the absorbing loss state last, its rate and the
+# parts of its matrix
+def _uniformized(rows, cols, rates, loss):
+    size = len(loss)
+    outflow = np.bincount(rows, weights=rates, minlength=size) + loss
+    uniform = float(np.max(outflow))
+    p_rows = np.concatenate([rows, np.arange(size), np.arange(size), [size]])
+    p_cols = np.concatenate([cols, np.arange(size), np.full(size, size), [size]])
+    p_values = np.concatenate([rates / uniform, 1. - outflow / uniform, loss / uniform, [1.]])
+    return uniform, p_rows, p_cols, p_values
+
+# sum of Poisson(lam) weighted powers of the chain applied to v, for the
+# given matrix-vector product
+def _poisson_sum(step, v, lam, tol):
+    result = np.zeros_like(v)
+    log_weight = -lam
+    j = 0
+    while True:
+        weight = math.exp(log_weight)
+        result += weight * v
+        # the remaining weights fall faster than a geometric series past lam
+        if j + 1 > lam and weight * lam / (j + 1 - lam) < tol:
+            return result
+        v = step(v)
+        j += 1
+        log_weight += math.log(lam) - math.log(j)
+
+def _sparse_loss(rows, cols, rates, loss, start, hours, tol):
+    uniform, p_rows, p_cols, p_values = _uniformized(rows, cols, rates, loss)
+    size = len(loss) + 1
+    v = np.zeros(size)
+    v[start] = 1.
+    step = lambda v: np.bincount(p_cols, weights=v[p_rows] * p_values, minlength=size)
+    return float(_poisson_sum(step, v, uniform * hours, tol)[-1])
+
+# exp(Q hours) = exp(Q hours / 2^s)^(2^s), with the short step uniformized;
+# all products involve nonnegative matrices only
+def _dense_loss(rows, cols, rates, loss, start, hours):
+    uniform, p_rows, p_cols, p_values = _uniformized(rows, cols, rates, loss)
+    size = len(loss) + 1
+    p = np.zeros((size, size))
+    np.add.at(p, (p_rows, p_cols), p_values)
+    lam = uniform * hours
+    squarings = max(0, int(math.ceil(math.log2(lam)))) if lam > 1 else 0
+    e = _poisson_sum(lambda m: m @ p, np.eye(size), lam / 2**squarings, 1E-18)
+    for _ in range(squarings):
+        e = e @ e
+    return float(e[start, -1])
@@ -0,0 +1,53 @@
+import concurrent.futures
+import functools
+import math
+import multiprocessing
+import os
+
+import cache
+
+# PARALLEL SWEEP RUNNER
+#
+# Splits a parameter grid into chunks and evaluates them on a process pool.
+# Results come back in grid order regardless of which worker finished first,
+# so a sweep returns exactly what the serial list comprehension would.
+#
+# Workers are forked so that functions of a script run as __main__ (such as
+# resilience_model.py) can be sent to them without re-importing the script.
+
+PROCESSES = int(os.environ.get("RAMP_PROCESSES", os.cpu_count() or 1))
+
+def _pool_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+def _run_chunk(func, chunk):
+    return [func(*params) for params in chunk]
+
+# func(chunk) in a worker, which then writes its new cache entries, since
+# workers exit without running atexit handlers
+def _worker_chunk(func, chunk):
+    try:
+        return func(chunk)
+    finally:
+        cache.flush()
+
+# Apply func to chunks of items, where func takes a list and returns a list of
+# the same length, and concatenate the results in order.
+def map_chunks(func, items, processes=None, chunksize=None):
+    items = list(items)
+    processes = PROCESSES if processes is None else processes
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(items) / (4*processes)))
+    chunks = [items[i:i+chunksize] for i in range(0, len(items), chunksize)]
+    if processes <= 1 or len(chunks) <= 1:
+        results = [func(chunk) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(processes, len(chunks)), mp_context=_pool_context()) as pool:
+            results = list(pool.map(functools.partial(_worker_chunk, func), chunks))
+    return [r for chunk in results for r in chunk]
+
+# [func(*params) for params in grid], evaluated on a process pool
+def run_sweep(func, grid, processes=None, chunksize=None):
+    return map_chunks(functools.partial(_run_chunk, func), grid, processes=processes, chunksize=chunksize)
@@ -0,0 +1,238 @@
+import math
+import numpy as np
+
+from ramp import K, P_RS, log_p_chipkill_vec, scheme_name
+
+# UNCERTAINTY PROPAGATION
+#
+# The figures use one point estimate of the RBER, while the RBER of real DIMMs
+# spreads over orders of magnitude. propagate draws the uncertain inputs from
+# their distributions and pushes every draw through p_chipkill and the scheme
+# p_due and a_r, all at once on arrays, and reports quantiles over the draws
+# that plot directly as bands over t.
+#
+# The draws come from a Sobol sequence instead of pseudo-random numbers: the
+# points fill the unit cube evenly, so quantiles and means converge about as
+# 1/samples instead of 1/sqrt(samples). Every replicate XORs the sequence
+# with its own random digital shift, which keeps the points evenly spread but
+# makes the replicates independent, so the spread of their means is an honest
+# standard error.
+#
+# Inputs, each fixed or a distribution:
+#
+#   rber   raw bit error rate
+#   p_rs   probability that the RS stage of chipkill fails, P_RS by default
+#   p_c    cache line failure probability; replaces the chipkill model
+#
+#   result = propagate({'rber': lognormal(2e-4, 0.5)}, [erasure_coding(6, 4)], t=range(0, 25))
+#   band = result['ec:6:4']['p_due']['quantiles']
+#   ax.fill_between(result['t'], band[0], band[-1])
+
+# DISTRIBUTIONS
+#
+# A distribution maps uniform numbers in (0, 1) to samples by its inverse
+# CDF, so that the Sobol points keep their structure.
+
+class fixed:
+    def __init__(self, value):
+        self.value = value
+
+    def ppf(self, u):
+        return np.full(np.shape(u), float(self.value))
+
+class uniform:
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    def ppf(self, u):
+        return self.lo + (self.hi - self.lo) * np.asarray(u)
+
+class loguniform:
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    def ppf(self, u):
+        return np.exp(math.log(self.lo) + (math.log(self.hi) - math.log(self.lo)) * np.asarray(u))
+
+# log-normal with the given median and a standard deviation of decades
+# orders of magnitude
+class lognormal:
+    def __init__(self, median, decades):
+        self.median = median
+        self.decades = decades
+
+    def ppf(self, u):
+        return self.median * 10.**(self.decades * norm_ppf(u))
+
+# distribution described by spec: a number, "fixed:V", "uniform:LO:HI",
+# "loguniform:LO:HI" or "lognormal:MEDIAN:DECADES"
+def parse_distribution(spec):
+    fields = spec.split(':')
+    kinds = {'fixed': (fixed, 1), 'uniform': (uniform, 2), 'loguniform': (loguniform, 2), 'lognormal': (lognormal, 2)}
+    if len(fields) == 1:
+        try:
+            return fixed(float(fields[0]))
+        except ValueError:
+            pass
+    if fields[0] in kinds and len(fields) == kinds[fields[0]][1] + 1:
+        return kinds[fields[0]][0](*[float(f) for f in fields[1:]])
+    raise ValueError(f"invalid distribution '{spec}', expected V, fixed:V, uniform:LO:HI, loguniform:LO:HI or lognormal:MEDIAN:DECADES")
+
+# inverse CDF of the standard normal distribution, by the rational
+# approximation of Acklam, which is accurate to a relative error of 1.2e-9
+_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01, -1.328068155288572e+01)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+
+def norm_ppf(u):
+    u = np.asarray(u, dtype=float)
+    tail = np.minimum(u, 1 - u)
+    q = np.sqrt(-2 * np.log(np.maximum(tail, 1e-300)))
+    x_tail = np.polyval(_C, q) / (np.polyval(_D + (1.,), q))
+    x_tail = np.where(u < 0.5, x_tail, -x_tail)
+    r = (u - 0.5)**2
+    x_mid = (u - 0.5) * np.polyval(_A, r) / np.polyval(_B + (1.,), r)
+    return np.where(tail < 0.02425, x_tail, x_mid)
+
+# SOBOL SEQUENCE
+#
+# Direction numbers of Joe and Kuo (new-joe-kuo-6.21201) for the dimensions
+# after the first, as (degree s, coefficients a, initial m_1..m_s). 32 bit
+# integers give up to 2^32 distinct points per dimension.
+
+_SOBOL_BITS = 32
+_SOBOL_PARAMETERS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+]
+
+SOBOL_MAX_DIMENSIONS = len(_SOBOL_PARAMETERS) + 1
+
+def _direction_numbers(dims):
+    v = np.zeros((dims, _SOBOL_BITS), dtype=np.uint64)
+    v[0] = [1 << (_SOBOL_BITS - 1 - j) for j in range(_SOBOL_BITS)]
+    for d in range(1, dims):
+        s, a, m_init = _SOBOL_PARAMETERS[d-1]
+        m = list(m_init)
+        for j in range(s, _SOBOL_BITS):
+            value = m[j-s] ^ (m[j-s] << s)
+            for i in range(1, s):
+                if (a >> (s - 1 - i)) & 1:
+                    value ^= m[j-i] << i
+            m.append(value)
+        v[d] = [m[j] << (_SOBOL_BITS - 1 - j) for j in range(_SOBOL_BITS)]
+    return v
+
+# points skip .. skip+count-1 of the Sobol sequence in dims dimensions, as
+# 32 bit integers of shape (count, dims); point i is the XOR of the direction
+# numbers selected by the bits of its Gray code
+def sobol_integers(count, dims, skip=0):
+    if not 1 <= dims <= SOBOL_MAX_DIMENSIONS:
+        raise ValueError(f"the Sobol sequence supports 1 to {SOBOL_MAX_DIMENSIONS} dimensions, got {dims}")
+    v = _direction_numbers(dims)
+    i = np.arange(skip, skip + count, dtype=np.uint64)
+    gray = i ^ (i >> np.uint64(1))
+    x = np.zeros((count, dims), dtype=np.uint64)
+    for j in range(_SOBOL_BITS):
+        bit = ((gray >> np.uint64(j)) & np.uint64(1)).astype(bool)
+        x[bit] ^= v[:, j]
+    return x
+
+# count points of a Sobol sequence in (0, 1)^dims, digitally shifted by
+# the random integers shift when given
+def sobol(count, dims, shift=None, skip=0):
+    x = sobol_integers(count, dims, skip)
+    if shift is not None:
+        x ^= np.asarray(shift, dtype=np.uint64)
+    # the midpoints of the 2^-32 cells, so that 0 and 1 never occur
+    return (x.astype(float) + 0.5) / 2.**_SOBOL_BITS
+
+# PROPAGATION
+
+INPUTS = ('rber', 'p_rs', 'p_c')
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# samples of the uncertain inputs, dict of arrays of shape (samples,); fixed
+# inputs take no dimension of the sequence
+def _draw(inputs, samples, rng):
+    uncertain = [name for name in INPUTS if name in inputs and not isinstance(inputs[name], fixed)]
+    u = sobol(samples, max(1, len(uncertain)), rng.integers(0, 2**_SOBOL_BITS, max(1, len(uncertain)), dtype=np.uint64))
+    draws = {name: inputs[name].ppf(u[:, i]) for i, name in enumerate(uncertain)}
+    for name in INPUTS:
+        if name in inputs and name not in draws:
+            draws[name] = inputs[name].ppf(np.zeros(samples))
+    return draws
+
+# Quantiles over the input distributions of p_c, and of p_due and a_r per
+# scheme, for every t. inputs maps names of INPUTS to distributions or
+# numbers; rber is required unless p_c is given. Returns
+#
+#   {'t': t, 'quantiles': q, 'samples': total draws,
+#    'p_c': {'quantiles': array (len(q), len(t)), 'mean': (len(t),), 'stderr': (len(t),)},
+#    '<scheme>': {'p_due': {...}, 'a_r': {...}}}
+#
+# Each replicate evaluates samples draws; samples should be a power of two.
+# Quantiles pool all draws, means and their standard errors come from the
+# replicates.
+def propagate(inputs, schemes, t, k=K, b=4096, c=64, samples=2**13, replicates=8,
+              quantiles=QUANTILES, seed=None, approximate=True):
+    inputs = {name: fixed(value) if isinstance(value, (int, float)) else value for name, value in inputs.items()}
+    unknown = set(inputs) - set(INPUTS)
+    if unknown:
+        raise ValueError(f"unknown inputs {sorted(unknown)}, expected {', '.join(INPUTS)}")
+    if 'rber' not in inputs and 'p_c' not in inputs:
+        raise ValueError("either rber or p_c needs a distribution")
+    tt = np.asarray(list(t) if not np.isscalar(t) else [t], dtype=int)
+    nn = k + (tt * (math.log(k, 2) + 1)).astype(int)
+    rng = np.random.default_rng(seed)
+    # per quantity, per replicate, the values of shape (len(t), samples)
+    values = {}
+    for _ in range(replicates):
+        draws = _draw(inputs, samples, rng)
+        if 'p_c' in draws:
+            log_p_c = np.broadcast_to(np.log(draws['p_c']), (len(tt), samples))
+        else:
+            log_p_c = log_p_chipkill_vec(nn[:, None], k, tt[:, None], draws['rber'][None, :], approximate=approximate)
+            if 'p_rs' in draws:
+                log_p_c = log_p_c + np.log(draws['p_rs'] / P_RS)
+        p_c = np.exp(log_p_c)
+        values.setdefault(('p_c', None), []).append(log_p_c)
+        for s in schemes:
+            values.setdefault((scheme_name(s), 'p_due'), []).append(s.log_p_due_vec(b, c, p_c))
+            values.setdefault((scheme_name(s), 'a_r'), []).append(np.broadcast_to(s.a_r_vec(b, c, p_c), p_c.shape))
+
+    result = {'t': tt, 'quantiles': np.asarray(quantiles), 'samples': samples * replicates}
+    for (group, quantity), runs in values.items():
+        runs = np.stack(runs)
+        # probabilities span many decades, so they are kept as logarithms
+        # until the end; quantiles commute with the monotone exp
+        log_scale = quantity != 'a_r'
+        pooled = np.moveaxis(runs, 1, 0).reshape(len(tt), -1)
+        q = np.quantile(pooled, quantiles, axis=1)
+        means = np.mean(np.exp(runs) if log_scale else runs, axis=2)
+        stats = {
+            'quantiles': np.exp(q) if log_scale else q,
+            'mean': means.mean(axis=0),
+            'stderr': means.std(axis=0, ddof=1) / math.sqrt(replicates) if replicates > 1 else np.full(len(tt), np.nan),
+        }
+        if quantity is None:
+            result[group] = stats
+        else:
+            result.setdefault(group, {})[quantity] = stats
+    return result
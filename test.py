@@ -14,7 +14,7 @@ from enoslib.config import config_context, set_config
 from enoslib.objects import Host, PathLike
 
 from memcached import Memcached, MemcachePerf
-from command import Command, Cgroup, Session
+from command import Command, Cgroup, Configfs, Session, host_facts
 
 en.init_logging(level=logging.INFO)
 
@@ -22,10 +22,8 @@ HYDRA_PATH: str = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
 
 def deploy_hydra(roles, fault_latency_us=30):
     """Deploy Hydra"""
-    # get infiniband IP address for each hydra server
-    ibip = Command(cmd = "ip -o -4 address show | grep eth | awk '$4 ~ /^10.10/ { print $4 }'", nodes = roles['hydra'])
-    ibip.deploy()
-    extra_vars = ibip.stdout_to_dict('ibip')
+    # infiniband IP address of each hydra server, discovered once and cached
+    extra_vars = {'ibip': host_facts().ibip(roles['hydra'])}
 
     # install hydra
     extra_vars.update({
@@ -36,23 +34,22 @@ def deploy_hydra(roles, fault_latency_us=30):
     r = run_ansible([_playbook], roles=roles, extra_vars=extra_vars)
 
     # deploy resource monitor
-    cmd = f"{HYDRA_PATH}/resource_monitor/resource_monitor -f {fault_latency_us} {{{{ hostvars[inventory_hostname]['ibip'][inventory_hostname] }}}} 9400"
-    resource_monitor = Session(Command(cmd), session = "resource_monitor", nodes = roles['monitor'], extra_vars = extra_vars)
+    ibip = extra_vars['ibip']
+    cmd = lambda node: f"{HYDRA_PATH}/resource_monitor/resource_monitor -f {fault_latency_us} {ibip[node.alias]} 9400"
+    resource_monitor = Session(Command(cmd), session = "resource_monitor", nodes = roles['monitor'])
     resource_monitor.deploy()
     resource_monitor.output()
 
     # deploy resilience manager
     cmd = f"{HYDRA_PATH}/setup/resilience_manager_setup.sh"
-    resilience_manager = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True, extra_vars = extra_vars)
+    resilience_manager = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True)
     resilience_manager.deploy()
     resilience_manager.output()
 
 def destroy_hydra(roles):
     """Destroy Hydra"""
-    # get infiniband IP address for each hydra server
-    ibip = Command(cmd = "ip -o -4 address show | grep eth | awk '$4 ~ /^10.10/ { print $4 }'", nodes = roles['hydra'])
-    ibip.deploy()
-    extra_vars = ibip.stdout_to_dict('ibip')
+    # infiniband IP address of each hydra server, discovered once and cached
+    extra_vars = {'ibip': host_facts().ibip(roles['hydra'])}
 
     # install hydra
     extra_vars.update({
@@ -64,49 +61,28 @@ def destroy_hydra(roles):
 
     # destroy resilience manager
     cmd = f"{HYDRA_PATH}/setup/resilience_manager_teardown.sh"
-    resilience_manager = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True, extra_vars = extra_vars)
+    resilience_manager = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True)
     resilience_manager.deploy()
     resilience_manager.output()
 
     # destroy resource monitor
-    cmd = f"{HYDRA_PATH}/resource_monitor/resource_monitor {{{{ hostvars[inventory_hostname]['ibip'][inventory_hostname] }}}} 9400"
-    resource_monitor = Session(Command(cmd), session = "resource_monitor", nodes = roles['monitor'], extra_vars = extra_vars)
+    resource_monitor = Session(Command(f"{HYDRA_PATH}/resource_monitor/resource_monitor"), session = "resource_monitor", nodes = roles['monitor'])
     resource_monitor.destroy()
 
-def set_fault_injection_enable(roles, val):
-    manager_alias = roles['manager'][0].alias
+HYDRA_CONFIGFS: str = "/sys/kernel/config/hydra/hydrahost0/hydra0"
 
-    # set fault injection
-    cmd = f"echo {val} | tee /sys/kernel/config/hydra/hydrahost0/hydra0/fault_injection_enable"
-    fault_injection_enable = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True)
-    fault_injection_enable.deploy()
+def configure_fault_injection(roles, **attributes):
+    """Write and verify fault injection attributes of the manager in one remote call"""
+    configfs = Configfs(HYDRA_CONFIGFS, nodes = roles['manager'])
+    return configfs.apply(attributes)
 
-    # validate fault injection
-    cmd = f"cat /sys/kernel/config/hydra/hydrahost0/hydra0/fault_injection_enable"
-    fault_injection_enable = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True)
-    fault_injection_enable.deploy()
-    stdout = fault_injection_enable.stdout_to_dict('key')['key']
-    assert(int(stdout[manager_alias]) == val)
+def set_fault_injection_enable(roles, val):
+    configure_fault_injection(roles, fault_injection_enable = val)
 
 def enable_fault_injection(roles, fault_rate = 1000):
-    manager_alias = roles['manager'][0].alias
-
-    # configure fault injection distribution
-    cmd = f"echo {fault_rate} | tee /sys/kernel/config/hydra/hydrahost0/hydra0/fault_injection_distr"
-    fault_injection_distr = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True)
-    fault_injection_distr.deploy()
-
-    # validate fault injection distribution
-    cmd = f"cat /sys/kernel/config/hydra/hydrahost0/hydra0/fault_injection_distr"
-    fault_injection_distr = Command(cmd, nodes = roles['manager'], remote_working_dir = os.path.join(HYDRA_PATH, "setup"), sudo = True)
-    fault_injection_distr.deploy()
-    stdout = fault_injection_distr.stdout_to_dict('key')['key']
-    assert(int(stdout[manager_alias]) == fault_rate)
-
-    set_fault_injection_enable(roles, 1)
+    configure_fault_injection(roles, fault_injection_distr = fault_rate, fault_injection_enable = 1)
 
 def disable_fault_injection(roles):
-    manager_alias = roles['manager'][0].alias
     set_fault_injection_enable(roles, 0)
 
 def deploy_memcached(roles, cgroup = True, mc_mem = 1024, cgroup_mem = 256):
@@ -126,14 +102,26 @@ def destroy_memcached(roles, cgroup = True, mc_mem = 1024, cgroup_mem = 256):
         memcached = Session(Memcached(mc_mem), session = "memcached", nodes = roles['manager'])
     memcached.destroy()
 
-def run_single(roles, records=3000000, qps=1000000, time=30, fault_rate=0):
+def memcache_perf_campaign(roles):
+    return MemcachePerf(master = roles['control'][0], workers = roles['workload'], threads=10, connections=1, measure_depth=1, measure_connections=1)
+
+def run_single(roles, records=3000000, qps=1000000, time=30, fault_rate=0, memcache_perf=None, force_load=False):
+    """Run one experiment point.
+
+    With memcache_perf of a campaign, its agents are reused and only restarted
+    when found dead; otherwise memcache-perf is deployed and stopped for this
+    point alone. The records are loaded only when memcached does not hold
+    them already, or always with force_load.
+    """
+    campaign = memcache_perf is not None
+    if not campaign:
+        memcache_perf = memcache_perf_campaign(roles)
+
     # prepare memcached
     disable_fault_injection(roles)
     memcached_server = roles["manager"][0].address
-    memcache_perf = MemcachePerf(master = roles['control'][0], workers = roles['workload'], threads=10, connections=1, measure_depth=1, measure_connections=1)
-    memcache_perf.destroy()
     memcache_perf.deploy()
-    memcache_perf.run_bench(server = memcached_server, load=True, records=records, iadist = "fb_ia", keysize = "fb_key", valuesize = "fb_value")
+    memcache_perf.load(server = memcached_server, records=records, iadist = "fb_ia", keysize = "fb_key", valuesize = "fb_value", force=force_load)
 
     # run experiment
     if fault_rate > 0:
@@ -141,23 +129,30 @@ def run_single(roles, records=3000000, qps=1000000, time=30, fault_rate=0):
     else:
         disable_fault_injection(roles)
     results = memcache_perf.run_bench(server = memcached_server, load=False, records=records, iadist = "fb_ia", keysize = "fb_key", valuesize = "fb_value", qps=qps, time=time)
-    memcache_perf.destroy()
+    if not campaign:
+        memcache_perf.destroy()
     return results
 
 
-def run_multiple(roles, root_results_dir_path, batch_name, iterations=1, records=3000000, time=30):
+def run_multiple(roles, root_results_dir_path, batch_name, iterations=1, records=3000000, time=30, force_load=False):
     results_dir_path = os.path.join(root_results_dir_path, batch_name)
     if not os.path.exists(results_dir_path):
         os.makedirs(results_dir_path)
 
-    for iteration in range(iterations):
-        for qps in [100000]:
-            for fault_rate in [0, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000, 1000000000]:
-                results = run_single(roles, records, qps, time, fault_rate)
-                results_file_name = "qps={}-fault_rate={}-{}".format(qps, fault_rate, iteration)
-                results_path_name = os.path.join(results_dir_path, results_file_name)
-                with open(results_path_name, 'w') as fo:
-                    print(results, file=fo)
+    # build memcache-perf and start its agents once for the whole campaign
+    memcache_perf = memcache_perf_campaign(roles)
+    memcache_perf.destroy()
+    try:
+        for iteration in range(iterations):
+            for qps in [100000]:
+                for fault_rate in [0, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000, 1000000000]:
+                    results = run_single(roles, records, qps, time, fault_rate, memcache_perf, force_load)
+                    results_file_name = "qps={}-fault_rate={}-{}".format(qps, fault_rate, iteration)
+                    results_path_name = os.path.join(results_dir_path, results_file_name)
+                    with open(results_path_name, 'w') as fo:
+                        print(results, file=fo)
+    finally:
+        memcache_perf.destroy()
 
 def main(argv):
     # path to the inventory